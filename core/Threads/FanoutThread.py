@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+
+import socket
+import traceback
+import multiprocessing
+
+from core.settings import PACKET_BATCH_SIZE
+from core.Threads.ProcessorThread import ProcessorThread
+from core.Threads.ReaderAndDecoderThread import read_count
+
+class FanoutThread(ProcessorThread):
+    """
+    Processor reading directly from its own socket inside AF_PACKET fanout group
+    (capturing and processing in the same process, without any queue in between)
+    """
+
+    def __init__(self, cap_stream):
+        ProcessorThread.__init__(self, None)
+
+        self.cap_stream = cap_stream
+        self.datalink = cap_stream.datalink()
+        self.frames = []
+
+    def callback(self, header, packet):
+        sec, usec = header.getts()
+        self.frames.append((self.datalink, sec, usec, packet))
+
+    def read_frames(self):
+        global read_count
+
+        self.frames = []
+
+        try:
+            self.cap_stream.dispatch(PACKET_BATCH_SIZE, self.callback)
+        except socket.error:
+            traceback.print_exc()
+
+        if self.frames:
+            with read_count.get_lock():
+                read_count.value += len(self.frames)
+
+        return self.frames
@@ -1,51 +1,101 @@
 #!/usr/bin/env python
 
 import Queue
+import time
 import traceback
 import click
 import multiprocessing
 import core.logger as logger
+import core.profiler as profiler
 
+from core.common import sync_trails
+from core.net.batch import unpack_batch
 from core.process_package import process_packet
+from core.settings import config
+from core.settings import END_BLOCK
+from core.settings import NO_BLOCK
+from core.settings import PACKET_BATCH_SIZE
 from core.settings import REGULAR_SENSOR_SLEEP_TIME
 from core.Threads.EventThread import event_queue
 
-packet_queue = multiprocessing.Queue(maxsize=100)
 exit_processor_thread = multiprocessing.Event()
 packet_count = multiprocessing.Value('L', 0)
 
 class ProcessorThread(multiprocessing.Process):
-    def __init__(self):
+    def __init__(self, packet_queue, packet_ring=None):
         multiprocessing.Process.__init__(self)
 
         self.packet_queue = packet_queue
-    
+        self.packet_ring = packet_ring
+
+    def read_frames(self):
+        """
+        Returns list of (datalink, sec, usec, frame) tuples (None at the end of stream)
+        """
+
+        if self.packet_ring is None:
+            try:
+                return unpack_batch(self.packet_queue.get(True, REGULAR_SENSOR_SLEEP_TIME))
+            except Queue.Empty:
+                return []
+
+        frames = []
+
+        while len(frames) < PACKET_BATCH_SIZE:
+            block = self.packet_ring.read_block()
+
+            if block == NO_BLOCK:
+                break
+            elif block == END_BLOCK:
+                return frames or None
+
+            frames.append(block)
+
+        if not frames:
+            time.sleep(REGULAR_SENSOR_SLEEP_TIME)
+
+        return frames
+
     def run(self):
         global packet_count
 
         # Listen for packets and process them
         while True:
             try:
-                sec, usec, packet = self.packet_queue.get(True, REGULAR_SENSOR_SLEEP_TIME)
-                event = None
-                
-                try:
-                    event = process_packet(packet, sec, usec)
-                    
-                except Exception:
-                    traceback.print_exc()
-                    pass
-                    
-                if event:
-                    event_queue.put(event)
-                
-                with packet_count.get_lock():
-                    packet_count.value += 1
+                frames = self.read_frames()
 
-            except Queue.Empty:
-                if exit_processor_thread.is_set():
+                if frames is None:
                     break
-                pass
-                
+
+                if not frames:
+                    if exit_processor_thread.is_set():
+                        break
+                    continue
+
+                # Note: updated trails are swapped in between batches
+                sync_trails()
+
+                # Note: time spent between capturing and processing (meaningless for packets read from file)
+                if config.USE_PROFILER and not config.pcap_file:
+                    now = time.time()
+                    for _, sec, usec, _ in frames:
+                        profiler.record(profiler.STAGE, "queue", now - sec - usec / 1000000.0)
+
+                for datalink, sec, usec, frame in frames:
+                    event = None
+
+                    try:
+                        event = process_packet(frame, sec, usec, datalink)
+
+                    except Exception:
+                        traceback.print_exc()
+                        pass
+
+                    if event:
+                        event_queue.put(event)
+
+                with packet_count.get_lock():
+                    packet_count.value += len(frames)
+
             except KeyboardInterrupt:
-                break
\ No newline at end of file
+                break
@@ -1,42 +1,180 @@
 #!/usr/bin/env python
 
 import pcapy
+import Queue
 import socket
 import traceback
 import time
 import click
 import multiprocessing
 
+from core.enums import OVERFLOW_POLICY
+from core.net.batch import batch_length
+from core.net.batch import pack_batch
+from core.net.flow import flow_hash
+from core.net.Packet import DECODERS
 from core.settings import config
+from core.settings import OVERFLOW_SAMPLE_RATE
+from core.settings import PACKET_BATCH_SIZE
+from core.settings import PACKET_BATCH_TIMEOUT
 from core.settings import REGULAR_SENSOR_SLEEP_TIME
-from impacket.ImpactDecoder import EthDecoder, LinuxSLLDecoder
-from core.Threads.ProcessorThread import packet_queue
+from core.settings import SHORT_SENSOR_SLEEP_TIME
 
 reader_end_of_file = multiprocessing.Event()
 exit_reader_and_decoder_thread = multiprocessing.Event()
 read_count = multiprocessing.Value('L', 0)
+overflow_count = multiprocessing.Value('L', 0)
 
 class ReaderAndDecoderThread(multiprocessing.Process):
-    def __init__(self, cap_stream):
+    def __init__(self, cap_stream, packet_queues, packet_rings=None):
         multiprocessing.Process.__init__(self)
         self.cap_stream = cap_stream
+        self.packet_queues = packet_queues
+        self.packet_rings = packet_rings
+        self.workers = len(packet_rings or packet_queues)
         self.datalink = cap_stream.datalink()
 
-        if pcapy.DLT_EN10MB == self.datalink:
-            self.decoder = EthDecoder()
-        elif pcapy.DLT_LINUX_SLL == self.datalink:
-            self.decoder = LinuxSLLDecoder()
+        if self.datalink not in DECODERS:
+            raise Exception("Datalink type not supported: %s" % self.datalink)
+
+        self.batches = [[] for _ in xrange(self.workers)]
+        self.batch_start = None
+        self.written = 0
+        self.dropped = 0
+        self.overflowed = 0
+        self.policy = config.QUEUE_OVERFLOW_POLICY or OVERFLOW_POLICY.BLOCK
+        self.sample_rate = config.QUEUE_OVERFLOW_SAMPLE_RATE or OVERFLOW_SAMPLE_RATE
+
+    def write(self, sec, usec, packet):
+        # Packets between the same pair of hosts (DNS packets of the same resolver) always go to the same worker
+        i = flow_hash(self.datalink, packet) % self.workers if self.workers > 1 else 0
+
+        if self.packet_rings:
+            # Packet is copied once into shared memory (no pickling)
+            if self.packet_rings[i].write_block(self.datalink, sec, usec, packet):
+                self.written += 1
+            else:
+                self.overflowed += 1
+
+                # Note: blocks can't be taken away from the (concurrently read) ring, hence 'drop-oldest' behaves as 'drop-newest' here
+                if self.policy == OVERFLOW_POLICY.BLOCK or self.policy == OVERFLOW_POLICY.SAMPLE and self.overflowed % self.sample_rate == 0:
+                    while not self.packet_rings[i].write_block(self.datalink, sec, usec, packet):
+                        if exit_reader_and_decoder_thread.is_set():
+                            return
+                        time.sleep(SHORT_SENSOR_SLEEP_TIME)
+                    self.written += 1
+                else:
+                    self.dropped += 1
+
+            if self.written + self.dropped >= PACKET_BATCH_SIZE:
+                self.flush()
         else:
-            raise Exception("Datalink type not supported: " % self.datalink)
+            # Raw frames are batched here and decoded on the processor side
+            self.batches[i].append((sec, usec, packet))
 
-    def run(self):
+            if len(self.batches[i]) >= PACKET_BATCH_SIZE:
+                self.flush_batch(i)
+
+        if self.batch_start is None:
+            self.batch_start = time.time()
+        elif time.time() - self.batch_start >= PACKET_BATCH_TIMEOUT:
+            self.flush()
+
+    def flush_batch(self, i):
+        batch, self.batches[i] = self.batches[i], []
+
+        if not batch:
+            return
+
+        if self.policy == OVERFLOW_POLICY.BLOCK:
+            self.packet_queues[i].put(pack_batch(self.datalink, batch))
+        else:
+            try:
+                self.packet_queues[i].put_nowait(pack_batch(self.datalink, batch))
+            except Queue.Full:
+                if self.policy == OVERFLOW_POLICY.DROP_OLDEST:
+                    try:
+                        self.dropped += batch_length(self.packet_queues[i].get(True, REGULAR_SENSOR_SLEEP_TIME))
+                    except Queue.Empty:  # taken by processor in the meantime
+                        pass
+
+                    try:
+                        self.packet_queues[i].put_nowait(pack_batch(self.datalink, batch))
+                    except Queue.Full:
+                        self.dropped += len(batch)
+                        return
+                elif self.policy == OVERFLOW_POLICY.SAMPLE:
+                    sample = batch[::self.sample_rate]
+                    self.dropped += len(batch) - len(sample)
+                    batch = sample
+                    self.packet_queues[i].put(pack_batch(self.datalink, batch))
+                else:
+                    self.dropped += len(batch)
+                    return
+
+        self.written += len(batch)
+
+    def flush(self):
         global read_count
+        global overflow_count
+
+        for i in xrange(len(self.batches)):
+            self.flush_batch(i)
+
+        if self.written:
+            with read_count.get_lock():
+                read_count.value += self.written
+
+            self.written = 0
+
+        if self.dropped:
+            with overflow_count.get_lock():
+                overflow_count.value += self.dropped
+
+            self.dropped = 0
+
+        self.batch_start = None
+
+    def run(self):
+        if config.USE_PCAP_DISPATCH:
+            self.run_dispatch()
+        else:
+            self.run_next()
+
+    def callback(self, header, packet):
+        sec, usec = header.getts()
+        self.write(sec, usec, packet)
 
+    def run_dispatch(self):
+        # Blocks inside libpcap (up to CAPTURE_TIMEOUT) and hands over up to PACKET_BATCH_SIZE packets per call
+        while True:
+            try:
+                # Quit reader (Keyboardinterrupt)
+                if exit_reader_and_decoder_thread.is_set():
+                    self.flush()
+                    break
+
+                count = self.cap_stream.dispatch(PACKET_BATCH_SIZE, self.callback)
+                self.flush()
+
+                if count == 0 and config.pcap_file:
+                    reader_end_of_file.set()
+                    break
+
+            except (pcapy.PcapError, socket.timeout):
+                traceback.print_exc()
+                time.sleep(REGULAR_SENSOR_SLEEP_TIME)
+
+            except KeyboardInterrupt:
+                break
+
+    def run_next(self):
         while True:
             success = False
             try:
                 # Quit reader (Keyboardinterrupt)
                 if exit_reader_and_decoder_thread.is_set():
+                    self.flush()
                     break
 
                 (header, packet) = self.cap_stream.next()
@@ -44,19 +182,20 @@ class ReaderAndDecoderThread(multiprocessing.Process):
                     success = True
                     sec, usec = header.getts()
 
-                    packet_queue.put((sec, usec, self.decoder.decode(packet)))
-                    
-                    with read_count.get_lock():
-                        read_count.value += 1
-                    
+                    self.write(sec, usec, packet)
+
                 elif config.pcap_file:
+                    self.flush()
                     reader_end_of_file.set()
                     break
-            
+
+                else:
+                    self.flush()
+
             except (pcapy.PcapError, socket.timeout):
                 traceback.print_exc()
                 pass
-            
+
             except KeyboardInterrupt:
                 break
 
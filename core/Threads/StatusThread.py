@@ -2,13 +2,39 @@
 
 import threading
 import core.logger as logger
+import core.profiler as profiler
 
+from core.settings import config
 from core.settings import REGULAR_SENSOR_SLEEP_TIME
 from core.Threads.EventThread import event_count
 from core.Threads.ProcessorThread import packet_count
+from core.Threads.ReaderAndDecoderThread import overflow_count
 from core.Threads.ReaderAndDecoderThread import read_count
 
-def print_status():
-    threading.Timer(5, print_status, []).start()
-    status_msg = 'PROGRESS: ' + str(read_count.value) + ' QUEUED | ' + str(packet_count.value) + ' PROCESSED | ' + str(event_count) + ' EVENTS'
+def get_capture_stats(caps):
+    """
+    Returns list of (interface, received, dropped, ifdropped) reported by pcap
+    """
+
+    retval = []
+
+    for interface, cap in caps:
+        try:
+            received, dropped, ifdropped = cap.stats()
+            retval.append((interface, received, dropped, ifdropped))
+        except Exception:
+            # e.g. offline capture files
+            pass
+
+    return retval
+
+def print_status(caps=()):
+    threading.Timer(5, print_status, [caps]).start()
+    status_msg = 'PROGRESS: ' + str(read_count.value) + ' QUEUED | ' + str(packet_count.value) + ' PROCESSED | ' + str(event_count) + ' EVENTS | ' + str(overflow_count.value) + ' DROPPED (OVERFLOW)'
     logger.debug(status_msg)
+
+    for interface, received, dropped, ifdropped in get_capture_stats(caps):
+        logger.debug('CAPTURE (%s): %d RECEIVED | %d DROPPED | %d IFDROPPED' % (interface, received, dropped, ifdropped))
+
+    if config.USE_PROFILER:
+        profiler.dump(logger.debug, { "queued": read_count.value, "processed": packet_count.value, "events": event_count, "dropped": overflow_count.value })
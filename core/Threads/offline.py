@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+import heapq
+import itertools
+import multiprocessing
+import pcapy
+import threading
+import time
+import traceback
+import core.logger as logger
+import core.profiler as profiler
+
+from core.common import sync_trails
+from core.events.emit import emit_event
+from core.net.pcapfile import CaptureFile
+from core.process_package import process_packet
+from core.settings import config
+from core.settings import CPU_CORES
+from core.settings import OFFLINE_CHUNK_SIZE
+from core.settings import SNAP_LEN
+
+_capture_filters = {}
+
+def capture_filter(datalink):
+    """
+    Returns CAPTURE_FILTER compiled for given link type (None if it can't be compiled)
+    """
+
+    if datalink not in _capture_filters:
+        try:
+            _capture_filters[datalink] = pcapy.compile(datalink, SNAP_LEN, config.CAPTURE_FILTER, True, 0)
+        except pcapy.PcapError, ex:
+            logger.error("unable to set capture filter for link type %d ('%s')" % (datalink, ex))
+            _capture_filters[datalink] = None
+
+    return _capture_filters[datalink]
+
+def analyze_chunk(task):
+    """
+    Processes packets of a single file chunk (inside of pool worker) and returns (packet count, events, profiler statistics)
+    """
+
+    filename, start, end, state = task
+
+    # Note: long running workers (e.g. directory watch) pick up trail updates between chunks
+    sync_trails()
+
+    capture = CaptureFile(filename)
+    events = []
+    count = 0
+
+    try:
+        for datalink, sec, usec, frame in capture.packets(start, end, state):
+            if config.CAPTURE_FILTER:
+                _ = capture_filter(datalink)
+                if _ is not None and not _.filter(frame):
+                    continue
+
+            count += 1
+
+            try:
+                event = process_packet(frame, sec, usec, datalink)
+            except Exception:
+                traceback.print_exc()
+                continue
+
+            if event:
+                events.append(event)
+    finally:
+        capture.close()
+
+    return count, events, profiler.take() if config.USE_PROFILER else None
+
+def first_timestamp(capture, chunk):
+    """
+    Returns (sec, usec) of the first packet inside of file chunk ((0, 0) for empty one)
+    """
+
+    for _, sec, usec, _ in capture.packets(*chunk):
+        return sec, usec
+
+    return 0, 0
+
+def analyze_files(filenames):
+    """
+    Analyzes pcap/pcapng file(s) with a pool of workers (events are emitted in timestamp order, as chunks get processed)
+    """
+
+    logger_thread = threading.Thread(target=logger.log_listener)
+    logger_thread.daemon = True
+    logger_thread.start()
+
+    tasks = []
+
+    for filename in filenames:
+        try:
+            capture = CaptureFile(filename)
+            tasks.extend((first_timestamp(capture, _), (filename,) + _) for _ in capture.split(OFFLINE_CHUNK_SIZE))
+            capture.close()
+        except (ValueError, EnvironmentError), ex:
+            exit("[!] unable to open capture file '%s' ('%s')" % (filename, ex))
+
+    # Note: chunks (of possibly overlapping files) are processed in order of their first packets (stable sort keeps order of chunks inside of file)
+    tasks.sort(key=lambda _: _[0])
+    starts = [_[0] for _ in tasks[1:]] + [None]
+    tasks = [_[1] for _ in tasks]
+
+    process_count = min(len(tasks), config.PROCESS_COUNT or CPU_CORES)
+    logger.info("analyzing %d chunk(s) of %d file(s) with %d worker(s)" % (len(tasks), len(filenames), process_count))
+
+    start = time.time()
+    packets = 0
+    emitted = 0
+    pending = []
+    sequence = itertools.count()
+
+    if config.USE_PROFILER:
+        profiler.disable_reports()
+
+    pool = multiprocessing.Pool(process_count)
+
+    try:
+        for i, (count, chunk_events, stats) in enumerate(pool.imap(analyze_chunk, tasks)):
+            packets += count
+            profiler.merge(stats)
+
+            # Note: sequence number keeps order of chunks (and packets inside of them) for equal timestamps
+            for event in chunk_events:
+                heapq.heappush(pending, (event.flow.sec, event.flow.usec, next(sequence), event))
+
+            # Note: only events not preceding the first packet of the next chunk have to wait for it (i.e. out of order timestamps at chunk boundaries)
+            while pending and (starts[i] is None or pending[0][:2] < starts[i]):
+                emit_event(heapq.heappop(pending)[-1])
+                emitted += 1
+
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    logger.info("processed %d packet(s) (%d event(s)) in %.2f s" % (packets, emitted, time.time() - start))
+
+    if config.USE_PROFILER:
+        profiler.dump(logger.info, { "processed": packets, "events": emitted })
@@ -1,38 +1,84 @@
 #!/usr/bin/env python
 
 import core.logger as logger
+import multiprocessing
 import threading
 
-from core.Threads.ReaderAndDecoderThread import exit_reader_and_decoder_thread
+from core.settings import config
+from core.Threads.ReaderAndDecoderThread import ReaderAndDecoderThread, exit_reader_and_decoder_thread
 from core.Threads.ProcessorThread import ProcessorThread, exit_processor_thread
 from core.Threads.EventThread import EventThread, exit_event_thread
+from core.Threads.FanoutThread import FanoutThread
+from core.Threads.ring import RingBuffer
 
-processor_thread = None
+processor_threads = []
 event_thread = None
+packet_queues = []
+packet_rings = []
 
 def init_threads():
-    global processor_thread
     global event_thread
-    
+
     logger_thread = threading.Thread(target=logger.log_listener)
     logger_thread.daemon = True
     logger_thread.start()
 
-    processor_thread = ProcessorThread()
-    processor_thread.start()
+    # Note: with AF_PACKET fanout every capturing socket gets its own processor (started by init_reader_threads)
+    process_count = max(1, config.PROCESS_COUNT or 1) if not config.AF_PACKET_FANOUT else 0
+
+    if config.CAPTURE_BUFFER and process_count:
+        logger.info("preparing capture buffer (%d MB)..." % (config.CAPTURE_BUFFER / 1024 / 1024))
+
+    for i in xrange(process_count):
+        packet_queue, packet_ring = None, None
+
+        if config.CAPTURE_BUFFER:
+            packet_ring = RingBuffer(config.CAPTURE_BUFFER / process_count)
+            packet_rings.append(packet_ring)
+        else:
+            packet_queue = multiprocessing.Queue(maxsize=100)
+            packet_queues.append(packet_queue)
+
+        processor_thread = ProcessorThread(packet_queue, packet_ring)
+        processor_thread.start()
+        processor_threads.append(processor_thread)
+
+    if process_count:
+        logger.info("started %d processing worker(s)" % process_count)
 
     event_thread = EventThread()
     event_thread.start()
-    
+
+def init_reader_threads(caps):
+    if config.AF_PACKET_FANOUT:
+        for cap in caps:
+            fanout_thread = FanoutThread(cap)
+            fanout_thread.start()
+            processor_threads.append(fanout_thread)
+
+        logger.info("started %d fanout worker(s) (mode '%s')" % (len(caps), config.AF_PACKET_FANOUT))
+
+        if config.AF_PACKET_FANOUT != "hash":
+            logger.warning("fanout mode '%s' spreads packets between the same pair of hosts over workers (thresholds of stateful plugins, e.g. DNS and port scanning, are effectively higher)" % config.AF_PACKET_FANOUT)
+        return
+
+    for cap in caps:
+        reader_and_decoder_thread = ReaderAndDecoderThread(cap, packet_queues, packet_rings)
+        reader_and_decoder_thread.daemon = True
+        reader_and_decoder_thread.start()
+
 def stop_threads():
     # Stop reader
     logger.info('Stopping reader and decoder thread...')
     exit_reader_and_decoder_thread.set()
 
-    # Stop processing thread
-    logger.info('Stopping processing thread...')
+    # Stop processing threads
+    logger.info('Stopping processing threads...')
     exit_processor_thread.set()
-    processor_thread.join()
+    for packet_ring in packet_rings:
+        packet_ring.write_end()
+    for processor_thread in processor_threads:
+        processor_thread.join()
 
     # Stop event thread
     logger.info('Stopping logger thread...')
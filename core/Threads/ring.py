@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) 2018-present Jasper De Moor (@DeMoorJasper)
+See the file 'LICENSE' for copying permission
+"""
+
+import mmap
+import struct
+import time
+import multiprocessing
+
+from core.enums import BLOCK_MARKER
+from core.settings import BLOCK_LENGTH
+from core.settings import END_BLOCK
+from core.settings import NO_BLOCK
+from core.settings import SHORT_SENSOR_SLEEP_TIME
+from core.settings import SNAP_LEN
+
+# Block layout: marker + short for packet size + int for sec + int for usec + int for datalink + packet data
+BLOCK_HEADER = struct.Struct("=HIII")
+BLOCK_DATA_OFFSET = 1 + BLOCK_HEADER.size
+
+class RingBuffer(object):
+    """
+    Anonymous shared memory (mmap) ring of fixed size blocks between capture
+    processes (writers) and a single processing process (reader)
+    """
+
+    def __init__(self, size):
+        self.count = max(1, size / BLOCK_LENGTH)
+        self.buffer = mmap.mmap(-1, self.count * BLOCK_LENGTH)
+        self.write_index = multiprocessing.Value('L', 0)
+        self.read_index = multiprocessing.Value('L', 0, lock=False)
+
+    def __len__(self):
+        return self.write_index.value - self.read_index.value
+
+    def is_full(self):
+        return len(self) >= self.count
+
+    def write_block(self, datalink, sec, usec, packet, marker=BLOCK_MARKER.NOP):
+        """
+        Copies packet into the next free block (returns False if ring is full)
+        """
+
+        packet = packet[:SNAP_LEN]
+
+        with self.write_index.get_lock():
+            i = self.write_index.value
+
+            if i - self.read_index.value >= self.count:
+                return False
+
+            offset = i % self.count * BLOCK_LENGTH
+
+            self.buffer[offset] = BLOCK_MARKER.WRITE
+            BLOCK_HEADER.pack_into(self.buffer, offset + 1, len(packet), sec, usec, datalink)
+            self.buffer[offset + BLOCK_DATA_OFFSET:offset + BLOCK_DATA_OFFSET + len(packet)] = packet
+            self.buffer[offset] = marker
+
+            self.write_index.value = i + 1
+
+        return True
+
+    def write_end(self):
+        """
+        Marks end of stream (processing side stops when it reaches it)
+        """
+
+        return self.write_block(0, 0, 0, "", BLOCK_MARKER.END)
+
+    def read_block(self):
+        """
+        Returns next (datalink, sec, usec, packet), NO_BLOCK or END_BLOCK
+        """
+
+        i = self.read_index.value
+
+        if i >= self.write_index.value:
+            return NO_BLOCK
+
+        offset = i % self.count * BLOCK_LENGTH
+
+        while self.buffer[offset] == BLOCK_MARKER.WRITE:
+            time.sleep(SHORT_SENSOR_SLEEP_TIME)
+
+        if self.buffer[offset] == BLOCK_MARKER.END:
+            self.buffer[offset] = BLOCK_MARKER.NOP
+            self.read_index.value = i + 1
+            return END_BLOCK
+
+        self.buffer[offset] = BLOCK_MARKER.READ
+
+        length, sec, usec, datalink = BLOCK_HEADER.unpack_from(self.buffer, offset + 1)
+        packet = self.buffer[offset + BLOCK_DATA_OFFSET:offset + BLOCK_DATA_OFFSET + length]
+
+        self.buffer[offset] = BLOCK_MARKER.NOP
+        self.read_index.value = i + 1
+
+        return (datalink, sec, usec, packet)
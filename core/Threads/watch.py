@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+
+import ctypes
+import ctypes.util
+import fnmatch
+import functools
+import json
+import multiprocessing
+import os
+import select
+import struct
+import threading
+import time
+import traceback
+import core.logger as logger
+import core.profiler as profiler
+
+from core.events.emit import emit_event
+from core.net.pcapfile import CaptureFile
+from core.settings import config
+from core.settings import CPU_CORES
+from core.settings import OFFLINE_CHUNK_SIZE
+from core.settings import WATCH_CHECKPOINT_FILE
+from core.settings import WATCH_POLL_INTERVAL
+from core.settings import WATCH_SETTLE_TIME
+from core.Threads.offline import analyze_chunk
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+INOTIFY_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len
+
+class Inotify(object):
+    """
+    Minimal (ctypes) inotify watch reporting files closed after writing (or moved into) directory
+    """
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+
+        self.fd = libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init failed")
+
+        if libc.inotify_add_watch(self.fd, directory, IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+
+    def read(self, timeout):
+        retval = []
+
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return retval
+
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+
+        while offset < len(data):
+            _, _, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            retval.append(data[offset:offset + length].rstrip('\x00'))
+            offset += length
+
+        return retval
+
+def analyze_file_chunk(task):
+    """
+    Processes file chunk (inside of pool worker) without letting a broken file stall its bookkeeping
+    """
+
+    try:
+        return analyze_chunk(task)
+    except Exception:
+        logger.error("problem occurred while processing '%s' ('%s')" % (task[0], traceback.format_exc()))
+        return 0, [], None
+
+class DirectoryWatcher(object):
+    """
+    Processes each completed capture file inside of directory (progress kept in checkpoint file)
+
+    Note: events of a file are emitted before its checkpoint entry is written (i.e. at least once delivery,
+    as file interrupted in between is processed again after restart)
+    """
+
+    def __init__(self, directory, pattern):
+        self.directory = directory
+        self.pattern = pattern
+        self.checkpoint = os.path.join(directory, WATCH_CHECKPOINT_FILE)
+        self.processed = {}
+        self.pending = {}
+        self.lock = threading.Lock()
+
+        if os.path.isfile(self.checkpoint):
+            try:
+                with open(self.checkpoint, "rb") as f:
+                    self.processed = json.load(f)
+            except ValueError:
+                logger.error("invalid checkpoint file '%s' (ignoring)" % self.checkpoint)
+
+        if config.USE_PROFILER:
+            profiler.disable_reports()
+
+        self.pool = multiprocessing.Pool(config.PROCESS_COUNT or CPU_CORES)
+
+    def _matches(self, name):
+        return not name.startswith('.') and fnmatch.fnmatch(name, self.pattern)
+
+    def _key(self, name):
+        _ = os.stat(os.path.join(self.directory, name))
+        return [_.st_size, int(_.st_mtime)]
+
+    def scan(self, settle=True):
+        """
+        Submits files considered completed (i.e. newer file already exists or no change for WATCH_SETTLE_TIME)
+        """
+
+        files = []
+
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if self._matches(name) and os.path.isfile(path):
+                files.append((os.path.getmtime(path), name))
+
+        files.sort()
+
+        for i, (mtime, name) in enumerate(files):
+            if i < len(files) - 1 or settle and time.time() - mtime >= WATCH_SETTLE_TIME:
+                self.submit(name)
+
+    def submit(self, name):
+        path = os.path.join(self.directory, name)
+
+        try:
+            key = self._key(name)
+        except OSError:  # rotated away in the meantime
+            return
+
+        with self.lock:
+            if name in self.pending or self.processed.get(name) == key:
+                return
+
+            try:
+                capture = CaptureFile(path)
+                chunks = capture.split(OFFLINE_CHUNK_SIZE)
+                capture.close()
+            except Exception, ex:
+                logger.error("skipping capture file '%s' ('%s')" % (path, ex))
+                self.processed[name] = key
+                self._save()
+                return
+
+            self.pending[name] = {"key": key, "remaining": len(chunks), "packets": 0, "events": [None] * len(chunks)}
+
+        logger.info("processing capture file '%s' (%d chunk(s))" % (path, len(chunks)))
+
+        for i, chunk in enumerate(chunks):
+            self.pool.apply_async(analyze_file_chunk, ((path,) + chunk,), callback=functools.partial(self._done, name, i))
+
+    def _done(self, name, i, result):
+        # Note: called from the (single) result handling thread of the pool (which must not die on an exception)
+        try:
+            self._finish(name, i, result)
+        except Exception:
+            logger.error("problem occurred while finishing '%s' ('%s')" % (os.path.join(self.directory, name), traceback.format_exc()))
+
+    def _finish(self, name, i, result):
+        count, events, stats = result
+        profiler.merge(stats)
+
+        with self.lock:
+            entry = self.pending[name]
+            entry["remaining"] -= 1
+            entry["packets"] += count
+            entry["events"][i] = events
+
+            if entry["remaining"]:
+                return
+
+            del self.pending[name]
+
+        events = [event for _ in entry["events"] for event in _]
+        events.sort(key=lambda event: (event.flow.sec, event.flow.usec))
+
+        for event in events:
+            emit_event(event)
+
+        with self.lock:
+            self.processed[name] = entry["key"]
+            self._save()
+
+        logger.info("processed capture file '%s' (%d packet(s), %d event(s))" % (os.path.join(self.directory, name), entry["packets"], len(events)))
+
+        if config.USE_PROFILER:
+            profiler.dump(logger.debug)
+
+    def _save(self):
+        # Note: entries of files removed by rotation are forgotten
+        for name in self.processed.keys():
+            if not os.path.exists(os.path.join(self.directory, name)):
+                del self.processed[name]
+
+        try:
+            with open("%s.tmp" % self.checkpoint, "w+b") as f:
+                json.dump(self.processed, f)
+
+            os.rename("%s.tmp" % self.checkpoint, self.checkpoint)
+        except (IOError, OSError), ex:
+            logger.error("unable to write checkpoint file '%s' ('%s')" % (self.checkpoint, ex))
+
+    def run(self):
+        try:
+            inotify = Inotify(self.directory)
+            logger.info("watching directory '%s' (inotify)" % self.directory)
+        except (OSError, AttributeError), ex:
+            inotify = None
+            logger.warning("inotify not available ('%s'). Polling directory '%s' every %d seconds" % (ex, self.directory, WATCH_POLL_INTERVAL))
+
+        # Note: scan after inotify is set up, so files closed in the meantime aren't missed
+        self.scan()
+
+        try:
+            while True:
+                if inotify:
+                    for name in inotify.read(WATCH_POLL_INTERVAL):
+                        if self._matches(name):
+                            self.submit(name)
+
+                    # Note: catches rotations missed by inotify (e.g. queue overflow), while still open files are left alone
+                    self.scan(settle=False)
+                else:
+                    time.sleep(WATCH_POLL_INTERVAL)
+                    self.scan()
+        finally:
+            self.pool.terminate()
+            self.pool.join()
+
+def watch_directory(directory):
+    logger_thread = threading.Thread(target=logger.log_listener)
+    logger_thread.daemon = True
+    logger_thread.start()
+
+    DirectoryWatcher(directory, config.WATCH_PATTERN or '*').run()
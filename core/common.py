@@ -22,14 +22,21 @@ from core.net.addr import int_to_addr
 from core.settings import BOGON_RANGES
 from core.settings import CHECK_CONNECTION_URL
 from core.settings import CDN_RANGES
+from core.settings import config
 from core.settings import NAME
 from core.settings import IPCAT_SQLITE_FILE
 from core.settings import STATIC_IPCAT_LOOKUPS
 from core.settings import TIMEOUT
 from core.settings import TRAILS_FILE
+from core.settings import TRAILS_SNAPSHOT_FILE
+from core.settings import trails
+from core.settings import trails_generation
 from core.settings import WHITELIST
+from core.settings import WHITELIST_FILE
 from core.settings import WHITELIST_RANGES
 from core.settings import WORST_ASNS
+from core.trails.snapshot import TrailsSnapshot
+from core.trails.snapshot import write_snapshot
 from core.trails.trailsdict import TrailsDict
 
 _ipcat_cache = {}
@@ -204,6 +211,17 @@ def get_regex(items):
 def check_connection():
     return len(retrieve_content(CHECK_CONNECTION_URL) or "") > 0
 
+def chown_file(filepath):
+    """
+    Gives file back to user running with sudo (if that's the case)
+    """
+
+    if os.path.exists(filepath):
+        try:
+            os.chown(filepath, int(os.environ.get("SUDO_UID", -1)), int(os.environ.get("SUDO_GID", -1)))
+        except Exception, ex:
+            logger.error("chown problem with '%s' ('%s')" % (filepath, ex))
+
 def check_whitelisted(trail):
     if trail in WHITELIST:
         return True
@@ -219,13 +237,101 @@ def check_whitelisted(trail):
 
     return False
 
+_trails_generation = 0
+
+def _trails_source():
+    _ = os.stat(TRAILS_FILE)
+    return (_.st_size, int(_.st_mtime))
+
+def open_trails_snapshot():
+    """
+    Returns TrailsSnapshot if it is up to date with trails file (and whitelists), None otherwise
+    """
+
+    if not os.path.isfile(TRAILS_SNAPSHOT_FILE) or not os.path.isfile(TRAILS_FILE):
+        return None
+
+    mtime = os.path.getmtime(TRAILS_SNAPSHOT_FILE)
+
+    for _ in (WHITELIST_FILE, config.USER_WHITELIST):
+        if _ and os.path.isfile(_) and os.path.getmtime(_) > mtime:
+            return None
+
+    try:
+        retval = TrailsSnapshot(TRAILS_SNAPSHOT_FILE)
+    except (ValueError, EnvironmentError), ex:
+        logger.error("unable to open trails snapshot ('%s')" % ex)
+        return None
+
+    return retval if retval.source == _trails_source() else None
+
+def store_trails_snapshot(trails):
+    """
+    Writes trails (as stored inside of trails file) into snapshot file. Returns TrailsDict backed by it (given trails if that fails)
+    """
+
+    try:
+        write_snapshot(TRAILS_SNAPSHOT_FILE, trails, _trails_source())
+    except (IOError, OSError), ex:
+        logger.error("something went wrong during trails snapshot write '%s' ('%s')" % (TRAILS_SNAPSHOT_FILE, ex))
+        return trails
+
+    chown_file(TRAILS_SNAPSHOT_FILE)
+
+    snapshot = open_trails_snapshot()
+
+    if snapshot is None:
+        return trails
+
+    retval = TrailsDict()
+    retval.attach(snapshot)
+
+    return retval
+
+def publish_trails(value):
+    """
+    Replaces trails of main process with given ones and announces their generation to worker processes
+    """
+
+    global _trails_generation
+
+    trails.replace(value)
+
+    if trails.generation is not None:
+        _trails_generation = trails_generation.value = trails.generation
+    else:
+        logger.warning("trails are not backed by snapshot (worker processes keep using the previous ones)")
+
+def sync_trails():
+    """
+    Swaps trails of (worker) process to the latest snapshot if main process announced a new generation
+    (to be called between batches, so each batch is processed with a single set of trails)
+    """
+
+    global _trails_generation
+
+    generation = trails_generation.value
+
+    if generation != _trails_generation:
+        _trails_generation = generation
+        snapshot = open_trails_snapshot()
+
+        if snapshot is None:
+            logger.error("unable to open updated trails snapshot (keeping the previous trails)")
+        else:
+            trails.attach(snapshot)
+
 def load_trails(quiet=False):
     if not quiet:
         logger.info("loading trails...")
 
     retval = TrailsDict()
+    snapshot = open_trails_snapshot()
+
+    if snapshot is not None:
+        retval.attach(snapshot)
 
-    if os.path.isfile(TRAILS_FILE):
+    elif os.path.isfile(TRAILS_FILE):
         try:
             with open(TRAILS_FILE, "rb") as f:
                 reader = csv.reader(f, delimiter=',', quotechar='\"')
@@ -238,6 +344,9 @@ def load_trails(quiet=False):
         except Exception, ex:
             exit("something went wrong during trails file read '%s' ('%s')" % (TRAILS_FILE, ex))
 
+        if retval:
+            retval = store_trails_snapshot(retval)
+
     if not quiet:
         _ = len(retval)
         try:
@@ -18,6 +18,12 @@ class BLOCK_MARKER:
     WRITE = chr(0x02)
     END = chr(0xFF)
 
+class OVERFLOW_POLICY:
+    BLOCK = "block"
+    DROP_NEWEST = "drop-newest"
+    DROP_OLDEST = "drop-oldest"
+    SAMPLE = "sample"
+
 class PROTO:
     TCP = "TCP"
     UDP = "UDP"
@@ -1,5 +1,3 @@
-import socket
-
 from core.settings import IPPROTO_LUT
 
 class SEVERITY:
@@ -9,11 +7,39 @@ class SEVERITY:
     HIGH = 3
     VERY_HIGH = 4
 
+class Flow(object):
+    """
+    Compact flow record filled once at event creation (everything triggers need to know about the packet)
+    """
+
+    __slots__ = ("sec", "usec", "src_ip", "src_port", "dst_ip", "dst_port", "protocol", "proto")
+
+    def __init__(self, packet):
+        self.sec = packet.sec
+        self.usec = packet.usec
+        self.src_ip = packet.src_ip
+        self.src_port = packet.src_port
+        self.dst_ip = packet.dst_ip
+        self.dst_port = packet.dst_port
+        self.protocol = packet.protocol
+        self.proto = IPPROTO_LUT.get(packet.protocol, packet.protocol)
+
+    def __getstate__(self):
+        return tuple(getattr(self, _) for _ in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
 class Event(object):
+    # Note: set when any of loaded triggers declares '__payload__' (otherwise packet is dropped right away)
+    keep_packet = False
+
     # proto, trail_type, trail, info, reference, ip_data
     def __init__(self, packet, trail_type, trail, info, reference, accuracy=0, severity=SEVERITY.VERY_LOW):
         # IP Package data
-        self.packet = packet
+        self.flow = Flow(packet)
+        self.packet = packet if Event.keep_packet else None
 
         # Event data
         self.trail_type = trail_type
@@ -26,23 +52,9 @@ class Event(object):
     # Tuple:
     # (sec, usec, source ip, source port, destination ip, destination port, protocol, trail type, trail, info, reference)
     def createTuple(self):
-        src_ip = self.packet.ip.get_ip_src()
-        dst_ip = self.packet.ip.get_ip_dst()
-        protocol = self.packet.ip.get_ip_p()
-        proto = IPPROTO_LUT[protocol]
-        src_port = "-"
-        dst_port = "-"
-
-        if protocol == socket.IPPROTO_TCP:
-            tcp_header = self.packet.ip.child()
-            src_port = tcp_header.get_th_sport()
-            dst_port = tcp_header.get_th_dport()
-        elif protocol == socket.IPPROTO_UDP:
-            udp_header = self.packet.ip.child()
-            src_port = udp_header.get_uh_sport()
-            dst_port = udp_header.get_uh_dport()
-
-        res = (self.packet.sec, self.packet.usec, src_ip, src_port, dst_ip, dst_port, proto, self.trail_type, 
+        flow = self.flow
+
+        res = (flow.sec, flow.usec, flow.src_ip, flow.src_port, flow.dst_ip, flow.dst_port, flow.proto, self.trail_type, 
             self.trail, self.info, self.reference)
         
         return res
\ No newline at end of file
@@ -1,6 +1,7 @@
 import traceback
 import time
 import core.logger as logger
+import core.profiler as profiler
 
 from core.events.ignore import ignore_event
 from core.common import check_whitelisted
@@ -16,12 +17,17 @@ def emit_event(event):
 
         # Run event triggers
         if config.trigger_functions:
+            start = time.time()
+
             for (_, function) in config.trigger_functions:
                 try:
                     function(event, config)
                 except Exception:
                     if config.SHOW_DEBUG:
                         traceback.print_exc()
+
+            if config.USE_PROFILER:
+                profiler.record(profiler.STAGE, "triggers", time.time() - start)
                         
     except (OSError, IOError):
         if config.SHOW_DEBUG:
@@ -1,50 +1,245 @@
 import struct
 import socket
-from impacket import ImpactPacket
+import pcapy
 
+from impacket.ImpactDecoder import EthDecoder, LinuxSLLDecoder, IPDecoder, IP6Decoder
+
+from core.net.decode import locate
+from core.net.http import parse_http
 from core.settings import LOCALHOST_IP
 from core.settings import IPPROTO_LUT
 from core.enums import PROTO
 
+DECODERS = { pcapy.DLT_EN10MB: EthDecoder, pcapy.DLT_LINUX_SLL: LinuxSLLDecoder }
+LOCALHOST_IP_INT = { 4: 0x7f000001, 6: 1 }
+IP_DECODERS = { 4: IPDecoder, 6: IP6Decoder }
+
+_decoders = {}
+_ip_decoders = {}
+
+class lazy(object):
+    """
+    Attribute computed on first access and stored into (underscore prefixed) slot afterwards
+    """
+
+    def __init__(self, function):
+        self.function = function
+        self.slot = "_%s" % function.__name__
+        self.__name__ = function.__name__
+        self.__doc__ = function.__doc__
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        try:
+            return getattr(instance, self.slot)
+        except AttributeError:  # empty slot
+            value = self.function(instance)
+            setattr(instance, self.slot, value)
+            return value
+
 class Packet(object):
-    def __init__(self, decodedFrame, sec, usec):
+    """
+    Packet decoded in place (header fields are read with struct at offsets into frame, without intermediate copies)
+    """
+
+    __slots__ = ("sec", "usec", "frame", "view", "datalink", "ip_version", "is_empty", "ip_offset", "iph_length", "l4_offset", "protocol",
+                 "_ethernet", "_ip", "_ip_end", "_ip_data", "_localhost_ip", "_localhost_ip_int", "_src_ip", "_dst_ip", "_src_ip_int", "_dst_ip_int", "_tcp", "_udp", "_src_port", "_dst_port", "_proto", "_payload_offset", "_payload", "_http")
+
+    def __init__(self, frame, sec, usec, datalink=pcapy.DLT_EN10MB):
         self.sec = sec
         self.usec = usec
+        self.frame = frame
+        self.view = memoryview(frame)
+        self.datalink = datalink
+        self.ip_version = None
+        self.is_empty = True
 
-        self.ethernet = decodedFrame
-        
         # TODO: Figure out how to handle non-ip based packets
-        if self.ethernet.get_ether_type() == ImpactPacket.IP.ethertype:
-            self.ip = self.ethernet.child()  # Parsed IP Packet
-
-            # !!! Everything below this comment is deprecated!
-            # !!! Do not use any of the keys defined after this comment on new code and plugins!
-            self.ip_data = self.ip.get_packet()
-            self.ip_version = self.ip.get_ip_v()
-            self.localhost_ip = LOCALHOST_IP[self.ip_version]
-            self.src_ip = self.ip.get_ip_src()
-            self.dst_ip = self.ip.get_ip_dst()
-            self.iph_length = self.ip.get_header_size()
-            self.protocol = self.ip.get_ip_p()
-            self.src_port = "-"
-            self.dst_port = "-"
-            self.proto = None  # Protocol name ex. TCP
+        # Note: tunneled (GRE/ERSPAN/VXLAN) packets are represented by their inner IP packet
+        _ = locate(datalink, frame)
+        if _ is None:
+            return
+
+        self.ip_version, self.ip_offset, self.protocol, self.iph_length = _
+        self.l4_offset = self.ip_offset + self.iph_length
+
+        if self.protocol == socket.IPPROTO_TCP:
+            self.is_empty = len(frame) < self.l4_offset + 14
+        elif self.protocol == socket.IPPROTO_UDP:
+            self.is_empty = len(frame) < self.l4_offset + 4
+        else:
             self.is_empty = False
 
-            if self.protocol == socket.IPPROTO_TCP:
-                self.proto = PROTO.TCP
-                tcp_data = self.ip_data[self.iph_length:self.iph_length+14]
-                self.tcp = struct.unpack("!HHLLBB", tcp_data)
-                self.src_port = self.tcp[0]
-                self.dst_port = self.tcp[1]
-            elif self.protocol == socket.IPPROTO_UDP:
-                self.proto = PROTO.UDP
-                udp_data = self.ip_data[self.iph_length:self.iph_length + 4]
-                if len(udp_data) < 4:
-                    self.is_empty = True
-                else:
-                    self.udp = struct.unpack("!HH", udp_data)
-                self.src_port = self.udp[0]
-                self.dst_port = self.udp[1]
-            else:
-                self.proto = IPPROTO_LUT[self.protocol]
+    def __getstate__(self):
+        # Note: memoryview can't be pickled (lazy attributes are recomputed on the other side)
+        return (self.frame, self.sec, self.usec, self.datalink)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    @lazy
+    def ethernet(self):
+        """
+        Full impacket decode (only done when plugin/trigger explicitly asks for it)
+        """
+
+        if self.datalink not in _decoders:
+            _decoders[self.datalink] = DECODERS[self.datalink]()
+
+        return _decoders[self.datalink].decode(self.frame)
+
+    @lazy
+    def ip(self):
+        if self.ip_version is None:
+            raise AttributeError("ip")
+
+        if self.ip_version not in _ip_decoders:
+            _ip_decoders[self.ip_version] = IP_DECODERS[self.ip_version]()
+
+        return _ip_decoders[self.ip_version].decode(self.frame[self.ip_offset:self.ip_end])  # Parsed (innermost) IP Packet
+
+    @lazy
+    def ip_end(self):
+        """
+        End offset of IP packet inside of frame (i.e. without link layer padding/trailer)
+        """
+
+        if self.ip_version == 6:
+            length = struct.unpack_from("!H", self.frame, self.ip_offset + 4)[0]
+            length = length + 40 if length else 0
+        else:
+            length = struct.unpack_from("!H", self.frame, self.ip_offset + 2)[0]
+
+        # Note: zero length is found in jumbograms and in packets captured before segmentation offload
+        return min(self.ip_offset + length, len(self.frame)) if length else len(self.frame)
+
+    @lazy
+    def ip_data(self):
+        """
+        View of IP packet (no copy)
+        """
+
+        return self.view[self.ip_offset:self.ip_end]
+
+    @lazy
+    def localhost_ip(self):
+        return LOCALHOST_IP[self.ip_version]
+
+    @lazy
+    def localhost_ip_int(self):
+        return LOCALHOST_IP_INT[self.ip_version]
+
+    @lazy
+    def src_ip_int(self):
+        """
+        Source address as integer (32-bit for IPv4, 128-bit for IPv6) taken straight from header
+        """
+
+        if self.ip_version == 6:
+            high, low = struct.unpack_from("!QQ", self.frame, self.ip_offset + 8)
+            return high << 64 | low
+
+        return struct.unpack_from("!I", self.frame, self.ip_offset + 12)[0]
+
+    @lazy
+    def dst_ip_int(self):
+        if self.ip_version == 6:
+            high, low = struct.unpack_from("!QQ", self.frame, self.ip_offset + 24)
+            return high << 64 | low
+
+        return struct.unpack_from("!I", self.frame, self.ip_offset + 16)[0]
+
+    @lazy
+    def src_ip(self):
+        if self.ip_version == 6:
+            return socket.inet_ntop(socket.AF_INET6, self.frame[self.ip_offset + 8:self.ip_offset + 24])
+
+        return socket.inet_ntoa(self.frame[self.ip_offset + 12:self.ip_offset + 16])
+
+    @lazy
+    def dst_ip(self):
+        if self.ip_version == 6:
+            return socket.inet_ntop(socket.AF_INET6, self.frame[self.ip_offset + 24:self.ip_offset + 40])
+
+        return socket.inet_ntoa(self.frame[self.ip_offset + 16:self.ip_offset + 20])
+
+    @lazy
+    def tcp(self):
+        if self.protocol != socket.IPPROTO_TCP:
+            raise AttributeError("tcp")
+
+        return struct.unpack_from("!HHLLBB", self.frame, self.l4_offset)
+
+    @lazy
+    def udp(self):
+        if self.protocol != socket.IPPROTO_UDP:
+            raise AttributeError("udp")
+
+        return struct.unpack_from("!HH", self.frame, self.l4_offset)
+
+    @lazy
+    def src_port(self):
+        if self.protocol == socket.IPPROTO_TCP:
+            return self.tcp[0]
+        elif self.protocol == socket.IPPROTO_UDP:
+            return self.udp[0]
+        else:
+            return "-"
+
+    @lazy
+    def dst_port(self):
+        if self.protocol == socket.IPPROTO_TCP:
+            return self.tcp[1]
+        elif self.protocol == socket.IPPROTO_UDP:
+            return self.udp[1]
+        else:
+            return "-"
+
+    @lazy
+    def proto(self):
+        """
+        Protocol name ex. TCP
+        """
+
+        if self.protocol == socket.IPPROTO_TCP:
+            return PROTO.TCP
+        elif self.protocol == socket.IPPROTO_UDP:
+            return PROTO.UDP
+        else:
+            return IPPROTO_LUT.get(self.protocol)
+
+    @lazy
+    def payload_offset(self):
+        """
+        Offset of TCP/UDP payload inside of frame (end of IP packet for other protocols)
+        """
+
+        if self.protocol == socket.IPPROTO_TCP:
+            return self.l4_offset + ((ord(self.frame[self.l4_offset + 12]) >> 4) << 2)
+        elif self.protocol == socket.IPPROTO_UDP:
+            return self.l4_offset + 8
+        else:
+            return self.ip_end
+
+    @lazy
+    def payload(self):
+        """
+        TCP/UDP payload as string (copied on first access, for plugins doing string matching)
+        """
+
+        return self.frame[self.payload_offset:self.ip_end]
+
+    @lazy
+    def http(self):
+        """
+        Parsed HTTP head of TCP payload (None if it doesn't start with HTTP request/status line)
+
+        Note: payload is parsed in place (i.e. body_offset is an offset into frame)
+        """
+
+        if self.protocol != socket.IPPROTO_TCP:
+            return None
+
+        return parse_http(self.frame, self.payload_offset, self.ip_end)
@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) 2018-present Jasper De Moor (@DeMoorJasper)
+See the file 'LICENSE' for copying permission
+"""
+
+# Linux AF_PACKET capture with TPACKET_V3 memory mapped RX ring (Reference: https://www.kernel.org/doc/Documentation/networking/packet_mmap.txt)
+
+import ctypes
+import fcntl
+import mmap
+import select
+import socket
+import struct
+import subprocess
+
+ETH_P_ALL = 0x0003
+SOL_PACKET = 263
+PACKET_ADD_MEMBERSHIP = 1
+PACKET_RX_RING = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION = 10
+PACKET_FANOUT = 18
+PACKET_FANOUT_DATA = 22
+PACKET_FANOUT_HASH = 0
+PACKET_FANOUT_CPU = 2
+PACKET_FANOUT_CBPF = 6
+PACKET_FANOUT_FLAG_DEFRAG = 0x8000
+PACKET_MR_PROMISC = 1
+TPACKET_V3 = 2
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+TP_STATUS_VLAN_VALID = 0x10
+TP_STATUS_VLAN_TPID_VALID = 0x40
+SO_ATTACH_FILTER = 26
+SIOCGIFINDEX = 0x8933
+DLT_EN10MB = 1
+
+# Note: 'hash' shards plain IPv4/IPv6 traffic by address pair (DNS by resolver address), while 'flow' uses kernel's 5-tuple flow hash.
+# Unlike core.net.flow.flow_hash, FANOUT_PROGRAM doesn't look inside of encapsulations: tunneled (GRE/ERSPAN/VXLAN) packets
+# are sharded by tunnel endpoints, while MPLS (and other non-IP) packets all go to the first socket ('flow' or 'cpu' should be used for such links)
+FANOUT_MODES = { "hash": PACKET_FANOUT_CBPF | PACKET_FANOUT_FLAG_DEFRAG, "flow": PACKET_FANOUT_HASH | PACKET_FANOUT_FLAG_DEFRAG, "cpu": PACKET_FANOUT_CPU }
+
+# Classic BPF (loads relative to network header; kernel takes returned value modulo number of sockets in group)
+BPF_LD_W_ABS, BPF_LD_H_ABS, BPF_LD_B_ABS, BPF_LD_H_IND, BPF_LDX_B_MSH = 0x20, 0x28, 0x30, 0x48, 0xb1
+BPF_JEQ_K, BPF_JSET_K, BPF_JA = 0x15, 0x45, 0x05
+BPF_XOR_X, BPF_RSH_K, BPF_TAX, BPF_RET_A, BPF_RET_K = 0xac, 0x74, 0x07, 0x16, 0x06
+SKF_AD_PROTOCOL = -0x1000
+SKF_NET_OFF = -0x100000
+DNS_PORT = 53
+
+def _fold(*offsets):
+    """
+    Returns instructions XOR-ing 32-bit words at given network header offsets into accumulator
+    """
+
+    retval = [(BPF_LD_W_ABS, 0, 0, SKF_NET_OFF + offsets[0])]
+
+    for offset in offsets[1:]:
+        retval += [(BPF_TAX, 0, 0, 0), (BPF_LD_W_ABS, 0, 0, SKF_NET_OFF + offset), (BPF_XOR_X, 0, 0, 0)]
+
+    return retval + [(BPF_JA, 0, 0, "mix")]
+
+def _dns(label, load_dport, load_sport):
+    """
+    Returns instructions jumping to '<label>.dst' (query), '<label>.src' (response) or '<label>.pair' (other UDP traffic)
+    """
+
+    return [
+        load_dport, (BPF_JEQ_K, 0, "%s.sport" % label, DNS_PORT),
+        load_sport, (BPF_JEQ_K, "%s.pair" % label, "%s.dst" % label, DNS_PORT),
+        "%s.sport" % label,
+        load_sport, (BPF_JEQ_K, "%s.src" % label, "%s.pair" % label, DNS_PORT),
+    ]
+
+FANOUT_PROGRAM = [
+    (BPF_LD_W_ABS, 0, 0, SKF_AD_PROTOCOL), (BPF_JEQ_K, "ip4", 0, 0x0800), (BPF_JEQ_K, "ip6", "other", 0x86dd),
+    "ip4",
+    (BPF_LD_B_ABS, 0, 0, SKF_NET_OFF + 9), (BPF_JEQ_K, 0, "ip4.pair", socket.IPPROTO_UDP),
+    (BPF_LD_H_ABS, 0, 0, SKF_NET_OFF + 6), (BPF_JSET_K, "ip4.pair", 0, 0x1fff),  # (non-first) fragment
+    (BPF_LDX_B_MSH, 0, 0, SKF_NET_OFF),
+] + _dns("ip4", (BPF_LD_H_IND, 0, 0, SKF_NET_OFF + 2), (BPF_LD_H_IND, 0, 0, SKF_NET_OFF)) + [
+    "ip4.dst"] + _fold(16) + [
+    "ip4.src"] + _fold(12) + [
+    "ip4.pair"] + _fold(12, 16) + [
+    "ip6",
+    (BPF_LD_B_ABS, 0, 0, SKF_NET_OFF + 6), (BPF_JEQ_K, 0, "ip6.pair", socket.IPPROTO_UDP),
+] + _dns("ip6", (BPF_LD_H_ABS, 0, 0, SKF_NET_OFF + 42), (BPF_LD_H_ABS, 0, 0, SKF_NET_OFF + 40)) + [
+    "ip6.dst"] + _fold(24, 28, 32, 36) + [
+    "ip6.src"] + _fold(8, 12, 16, 20) + [
+    "ip6.pair"] + _fold(8, 12, 16, 20, 24, 28, 32, 36) + [
+    "mix",
+    (BPF_TAX, 0, 0, 0), (BPF_RSH_K, 0, 0, 16), (BPF_XOR_X, 0, 0, 0),
+    (BPF_TAX, 0, 0, 0), (BPF_RSH_K, 0, 0, 8), (BPF_XOR_X, 0, 0, 0),
+    (BPF_RET_A, 0, 0, 0),
+    "other",
+    (BPF_RET_K, 0, 0, 0),
+]
+
+def assemble(program):
+    """
+    Returns classic BPF bytecode for program (instructions interleaved with label names used as jump targets)
+    """
+
+    labels, instructions = {}, []
+
+    for _ in program:
+        if isinstance(_, basestring):
+            labels[_] = len(instructions)
+        else:
+            instructions.append(_)
+
+    retval = ""
+
+    for i, (code, jt, jf, k) in enumerate(instructions):
+        if code == BPF_JA:
+            k = labels[k] - i - 1
+        jt, jf = (labels[_] - i - 1 if isinstance(_, basestring) else _ for _ in (jt, jf))
+        retval += struct.pack("HBBI", code, jt, jf, k & 0xffffffff)
+
+    return len(instructions), retval
+
+TPACKET_BLOCK_SIZE = 1 << 22
+TPACKET_FRAME_SIZE = 1 << 11
+
+BLOCK_STATUS_OFFSET = 8
+BLOCK_HEADER = struct.Struct("=III")  # block_status, num_pkts, offset_to_first_pkt
+PACKET_HEADER = struct.Struct("=IIIIIIHHIIH")  # next_offset, sec, nsec, snaplen, len, status, mac, net, rxhash, vlan_tci, vlan_tpid
+
+class Pkthdr(object):
+    """
+    Mimics pcapy's packet header object
+    """
+
+    def __init__(self, sec, usec, caplen, length):
+        self.sec = sec
+        self.usec = usec
+        self.caplen = caplen
+        self.length = length
+
+    def getts(self):
+        return (self.sec, self.usec)
+
+    def getcaplen(self):
+        return self.caplen
+
+    def getlen(self):
+        return self.length
+
+class AFPacketCapture(object):
+    """
+    Capture object exposing the same interface as pcapy's Reader (next, dispatch, datalink, setfilter, stats)
+    """
+
+    def __init__(self, interface, snaplen, promisc, timeout, ring_size):
+        self.interface = interface
+        self.snaplen = snaplen
+        self.timeout = timeout
+        self.block_nr = max(1, ring_size / TPACKET_BLOCK_SIZE)
+        self.block = 0
+        self.remaining = 0
+        self.offset = None
+        self.stats_received = 0
+        self.stats_dropped = 0
+
+        # Note: unbound socket would mix frames of different link types (e.g. loopback, tun, PPP) under DLT_EN10MB
+        if interface.lower() == "any":
+            raise ValueError("virtual interface 'any' is not supported by AF_PACKET capture")
+
+        self.socket = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        self.socket.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+        self.socket.setsockopt(SOL_PACKET, PACKET_RX_RING, struct.pack("=IIIIIII", TPACKET_BLOCK_SIZE, self.block_nr, TPACKET_FRAME_SIZE, TPACKET_BLOCK_SIZE / TPACKET_FRAME_SIZE * self.block_nr, timeout, 0, 0))
+
+        self.ring = mmap.mmap(self.socket.fileno(), TPACKET_BLOCK_SIZE * self.block_nr, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+
+        self.socket.bind((interface, ETH_P_ALL))
+
+        if promisc:
+            ifindex = struct.unpack("16sI", fcntl.ioctl(self.socket.fileno(), SIOCGIFINDEX, struct.pack("16sI", interface, 0)))[1]
+            self.socket.setsockopt(SOL_PACKET, PACKET_ADD_MEMBERSHIP, struct.pack("iHH8s", ifindex, PACKET_MR_PROMISC, 0, ""))
+
+        self.poll = select.poll()
+        self.poll.register(self.socket.fileno(), select.POLLIN | select.POLLERR)
+
+    def join_fanout(self, group, mode):
+        """
+        Joins fanout group (kernel balances packets between all sockets in the same group)
+        """
+
+        self.socket.setsockopt(SOL_PACKET, PACKET_FANOUT, struct.pack("=I", (group & 0xffff) | (FANOUT_MODES[mode] << 16)))
+
+        if FANOUT_MODES[mode] & 0xff == PACKET_FANOUT_CBPF:
+            count, instructions = assemble(FANOUT_PROGRAM)
+            self._fanout_program = ctypes.create_string_buffer(instructions, len(instructions))
+            self.socket.setsockopt(SOL_PACKET, PACKET_FANOUT_DATA, struct.pack("HL", count, ctypes.addressof(self._fanout_program)))
+
+    def datalink(self):
+        return DLT_EN10MB
+
+    def setfilter(self, value):
+        """
+        Attaches BPF filter (compiled with 'tcpdump -ddd' as there is no libpcap compiler at hand)
+        """
+
+        try:
+            output = subprocess.check_output(["tcpdump", "-i", self.interface, "-ddd", value], stderr=subprocess.STDOUT)
+        except (OSError, subprocess.CalledProcessError), ex:
+            raise ValueError("unable to compile capture filter with 'tcpdump' ('%s')" % (getattr(ex, "output", None) or ex))
+
+        lines = output.strip().split("\n")
+        instructions = "".join(struct.pack("HBBI", *(int(_) for _ in line.split())) for line in lines[1:])
+
+        self._filter = ctypes.create_string_buffer(instructions, len(instructions))
+        self.socket.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, struct.pack("HL", int(lines[0]), ctypes.addressof(self._filter)))
+
+    def stats(self):
+        # Note: kernel resets counters on every read (tp_packets already includes tp_drops)
+        packets, drops, _ = struct.unpack("III", self.socket.getsockopt(SOL_PACKET, PACKET_STATISTICS, 12))
+        self.stats_received += packets
+        self.stats_dropped += drops
+
+        return (self.stats_received, self.stats_dropped, 0)
+
+    def _acquire(self, timeout):
+        """
+        Waits (up to timeout ms) for current block to be handed over to user space
+        """
+
+        offset = self.block * TPACKET_BLOCK_SIZE
+        status, count, first = BLOCK_HEADER.unpack_from(self.ring, offset + BLOCK_STATUS_OFFSET)
+
+        if not status & TP_STATUS_USER:
+            if not timeout:
+                return False
+
+            self.poll.poll(timeout)
+            status, count, first = BLOCK_HEADER.unpack_from(self.ring, offset + BLOCK_STATUS_OFFSET)
+
+            if not status & TP_STATUS_USER:
+                return False
+
+        if not count:
+            self._release()
+            return False
+
+        self.remaining = count
+        self.offset = offset + first
+
+        return True
+
+    def _release(self):
+        struct.pack_into("=I", self.ring, self.block * TPACKET_BLOCK_SIZE + BLOCK_STATUS_OFFSET, TP_STATUS_KERNEL)
+        self.block = (self.block + 1) % self.block_nr
+        self.remaining = 0
+        self.offset = None
+
+    def _read(self):
+        """
+        Reads packet at current position (walking the block in place)
+        """
+
+        next_offset, sec, nsec, caplen, length, status, mac, _, _, vlan_tci, vlan_tpid = PACKET_HEADER.unpack_from(self.ring, self.offset)
+        start = self.offset + mac
+        packet = self.ring[start:start + min(caplen, self.snaplen)]
+
+        # Note: kernel strips 802.1Q tag (restored here so frames look like the ones coming from libpcap)
+        if status & TP_STATUS_VLAN_VALID:
+            packet = packet[:12] + struct.pack("!HH", vlan_tpid if status & TP_STATUS_VLAN_TPID_VALID else 0x8100, vlan_tci) + packet[12:]
+
+        self.remaining -= 1
+        if self.remaining:
+            self.offset += next_offset
+        else:
+            self._release()
+
+        return Pkthdr(sec, nsec / 1000, len(packet), length), packet
+
+    def next(self):
+        if not self.remaining and not self._acquire(self.timeout):
+            return (None, "")
+
+        return self._read()
+
+    def dispatch(self, maxcant, callback):
+        count = 0
+
+        while maxcant <= 0 or count < maxcant:
+            if not self.remaining and not self._acquire(0 if count else self.timeout):
+                break
+
+            header, packet = self._read()
+            callback(header, packet)
+            count += 1
+
+        return count
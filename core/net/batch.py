@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) 2018-present Jasper De Moor (@DeMoorJasper)
+See the file 'LICENSE' for copying permission
+"""
+
+import struct
+
+# Chunk layout: datalink + frame count, followed by one (sec, usec, length) header and raw frame per packet
+BATCH_HEADER = struct.Struct("!HI")
+FRAME_HEADER = struct.Struct("!III")  # Note: length of (e.g. GRO/TSO or jumbo) frame can exceed 65535
+
+def pack_batch(datalink, frames):
+    """
+    Packs list of (sec, usec, frame) tuples into a single length-prefixed chunk
+    """
+
+    retval = [BATCH_HEADER.pack(datalink, len(frames))]
+
+    for sec, usec, frame in frames:
+        retval.append(FRAME_HEADER.pack(sec, usec, len(frame)))
+        retval.append(frame)
+
+    return "".join(retval)
+
+def unpack_batch(chunk):
+    """
+    Unpacks chunk created with pack_batch() into [(datalink, sec, usec, frame), ...]
+    """
+
+    datalink, count = BATCH_HEADER.unpack_from(chunk, 0)
+    offset = BATCH_HEADER.size
+    frames = []
+
+    for _ in xrange(count):
+        sec, usec, length = FRAME_HEADER.unpack_from(chunk, offset)
+        offset += FRAME_HEADER.size
+        frames.append((datalink, sec, usec, chunk[offset:offset + length]))
+        offset += length
+
+    return frames
+
+def batch_length(chunk):
+    """
+    Returns number of frames inside chunk created with pack_batch()
+    """
+
+    return BATCH_HEADER.unpack_from(chunk, 0)[1]
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) 2018-present Jasper De Moor (@DeMoorJasper)
+See the file 'LICENSE' for copying permission
+"""
+
+# Single pass (struct based) location of network layer inside of raw frame (peeling VLAN/MPLS and GRE/ERSPAN/VXLAN)
+
+import socket
+import struct
+
+DLT_EN10MB = 1
+DLT_LINUX_SLL = 113
+
+ETHER_TYPE_OFFSETS = { DLT_EN10MB: 12, DLT_LINUX_SLL: 14 }
+
+ETHERTYPE_IP = 0x0800
+ETHERTYPE_IPV6 = 0x86dd
+ETHERTYPE_VLANS = (0x8100, 0x88a8, 0x9100)  # 802.1Q, 802.1ad (QinQ), legacy QinQ
+ETHERTYPE_MPLS = (0x8847, 0x8848)  # unicast, multicast
+
+# Reference: https://www.iana.org/assignments/ipv6-parameters/ipv6-parameters.xhtml#extension-header
+IPV6_EXTENSION_HEADERS = (socket.IPPROTO_HOPOPTS, socket.IPPROTO_ROUTING, socket.IPPROTO_DSTOPTS, 135, 139, 140)  # (+ Mobility, HIP, Shim6)
+IPV6_HEADER_LENGTH = 40
+
+# Reference: https://tools.ietf.org/html/draft-foschiano-erspan-03, https://tools.ietf.org/html/rfc7348
+GRE_CHECKSUM, GRE_KEY, GRE_SEQUENCE, GRE_VERSION = 0x8000, 0x2000, 0x1000, 0x0007
+GRE_ERSPAN_II = 0x88be  # (type I when GRE sequence number is not present)
+GRE_ERSPAN_III = 0x22eb
+GRE_TRANSPARENT_ETHERNET = 0x6558
+ERSPAN_II_HEADER_LENGTH = 8
+ERSPAN_III_HEADER_LENGTH = 12
+ERSPAN_III_SUBHEADER_LENGTH = 8
+VXLAN_PORT = 4789
+VXLAN_HEADER_LENGTH = 8
+
+def find_ip(datalink, frame):
+    """
+    Returns (ip_version, offset) of IP header inside of frame, skipping any number of VLAN tags and MPLS labels
+    (None, None) if there is none
+    """
+
+    offset = ETHER_TYPE_OFFSETS.get(datalink)
+
+    if offset is None:
+        return None, None
+
+    return _find_ip(frame, offset)
+
+def _find_ip(frame, offset):
+    """
+    Same as find_ip, with offset pointing to (Ethernet) ether type
+    """
+
+    if len(frame) < offset + 2:
+        return None, None
+
+    ether_type = struct.unpack_from("!H", frame, offset)[0]
+    offset += 2
+
+    while ether_type in ETHERTYPE_VLANS and len(frame) >= offset + 4:
+        ether_type = struct.unpack_from("!H", frame, offset + 2)[0]
+        offset += 4
+
+    if ether_type == ETHERTYPE_IP:
+        return 4, offset
+    elif ether_type == ETHERTYPE_IPV6:
+        return 6, offset
+    elif ether_type in ETHERTYPE_MPLS:
+        while len(frame) >= offset + 4:
+            bottom = ord(frame[offset + 2]) & 0x01
+            offset += 4
+
+            if bottom:
+                # Note: MPLS doesn't tell the payload type (IP version nibble is the common heuristic)
+                version = ord(frame[offset]) >> 4 if len(frame) > offset else None
+                if version in (4, 6):
+                    return version, offset
+                break
+
+    return None, None
+
+def walk_ipv6(frame, offset):
+    """
+    Returns (protocol, header length) of IPv6 packet at offset, walking over extension headers
+    (protocol is IPPROTO_FRAGMENT in case of non-first fragment as it doesn't carry upper layer header)
+    """
+
+    protocol = ord(frame[offset + 6])
+    length = IPV6_HEADER_LENGTH
+
+    while len(frame) >= offset + length + 8:
+        if protocol in IPV6_EXTENSION_HEADERS:
+            _ = (ord(frame[offset + length + 1]) + 1) << 3
+        elif protocol == socket.IPPROTO_AH:
+            _ = (ord(frame[offset + length + 1]) + 2) << 2
+        elif protocol == socket.IPPROTO_FRAGMENT:
+            if struct.unpack_from("!H", frame, offset + length + 2)[0] & 0xfff8:
+                break
+            _ = 8
+        else:
+            break
+
+        protocol = ord(frame[offset + length])
+        length += _
+
+    return protocol, length
+
+def decapsulate(frame, protocol, offset):
+    """
+    Returns (ip_version, offset) of IP header carried inside of GRE/ERSPAN (type I, II or III) or VXLAN tunnel
+    whose (outer) transport header starts at offset, (None, None) if there is none
+    """
+
+    if protocol == socket.IPPROTO_GRE and len(frame) >= offset + 4:
+        flags, protocol = struct.unpack_from("!HH", frame, offset)
+
+        if flags & GRE_VERSION:  # e.g. PPTP (enhanced GRE)
+            return None, None
+
+        offset += 4 + 4 * (bool(flags & GRE_CHECKSUM) + bool(flags & GRE_KEY) + bool(flags & GRE_SEQUENCE))
+
+        if protocol == ETHERTYPE_IP:
+            return 4, offset
+        elif protocol == ETHERTYPE_IPV6:
+            return 6, offset
+        elif protocol == GRE_ERSPAN_II:
+            if flags & GRE_SEQUENCE:
+                offset += ERSPAN_II_HEADER_LENGTH
+        elif protocol == GRE_ERSPAN_III:
+            if len(frame) < offset + ERSPAN_III_HEADER_LENGTH:
+                return None, None
+            offset += ERSPAN_III_HEADER_LENGTH + (ERSPAN_III_SUBHEADER_LENGTH if ord(frame[offset + 11]) & 0x01 else 0)
+        elif protocol != GRE_TRANSPARENT_ETHERNET:
+            return None, None
+
+        return _find_ip(frame, offset + 12)  # inner Ethernet frame
+
+    elif protocol == socket.IPPROTO_UDP and len(frame) >= offset + 8 + VXLAN_HEADER_LENGTH:
+        if struct.unpack_from("!H", frame, offset + 2)[0] == VXLAN_PORT and ord(frame[offset + 8]) & 0x08:  # VNI flag
+            return _find_ip(frame, offset + 8 + VXLAN_HEADER_LENGTH + 12)
+
+    return None, None
+
+def locate(datalink, frame):
+    """
+    Returns (ip_version, offset, protocol, header length) of the innermost IP packet inside of frame (None if there is none)
+    """
+
+    version, offset = find_ip(datalink, frame)
+
+    while version:
+        if version == 4:
+            if len(frame) < offset + 20:
+                return None
+
+            length = (ord(frame[offset]) & 0xf) << 2
+            protocol = ord(frame[offset + 9])
+        else:
+            if len(frame) < offset + IPV6_HEADER_LENGTH:
+                return None
+
+            protocol, length = walk_ipv6(frame, offset)
+
+        inner_version, inner_offset = decapsulate(frame, protocol, offset + length)
+
+        if inner_version is None:
+            return version, offset, protocol, length
+
+        version, offset = inner_version, inner_offset
+
+    return None
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) 2018-present Jasper De Moor (@DeMoorJasper)
+See the file 'LICENSE' for copying permission
+"""
+
+import socket
+
+from core.net.decode import locate
+
+DNS_PORT = 53
+
+def flow_hash(datalink, frame):
+    """
+    Returns symmetric hash of source/destination address pair found in raw frame (inner pair for tunneled traffic)
+    (same value for both directions, so all flows between two hosts share it)
+
+    Note: UDP DNS traffic is hashed by resolver address only, as DNS state of plugins (e.g. NXDOMAIN counters)
+    is kept per domain across all clients
+    """
+
+    _ = locate(datalink, frame)
+
+    if _ is None:  # non-IP (or truncated) frame
+        return 0
+
+    version, offset, protocol, length = _
+
+    if version == 4:
+        src, dst = frame[offset + 12:offset + 16], frame[offset + 16:offset + 20]
+        fragment = (ord(frame[offset + 6]) & 0x1f) or ord(frame[offset + 7])
+    elif version == 6:
+        src, dst = frame[offset + 8:offset + 24], frame[offset + 24:offset + 40]
+        fragment = False
+
+    if protocol == socket.IPPROTO_UDP and not fragment and len(frame) >= offset + length + 4:
+        sport = ord(frame[offset + length]) << 8 | ord(frame[offset + length + 1])
+        dport = ord(frame[offset + length + 2]) << 8 | ord(frame[offset + length + 3])
+
+        if dport == DNS_PORT and sport != DNS_PORT:
+            return hash(dst)
+        elif sport == DNS_PORT and dport != DNS_PORT:
+            return hash(src)
+
+    return hash(src) ^ hash(dst)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) 2018-present Jasper De Moor (@DeMoorJasper)
+See the file 'LICENSE' for copying permission
+"""
+
+# Single pass parsing of HTTP request/response head (shared by all plugins through Packet.http)
+
+HTTP_HEAD_SEPARATOR = "\r\n\r\n"
+
+class HTTPHead(object):
+    """
+    Parsed HTTP head: start line, headers (lower case names, first occurrence, stripped values) and body offset (inside of parsed data)
+    """
+
+    __slots__ = ("response", "method", "path", "version", "head", "headers", "body_offset")
+
+    def __init__(self, response, method, path, version, head, headers, body_offset):
+        self.response = response
+        self.method = method
+        self.path = path
+        self.version = version
+        self.head = head
+        self.headers = headers
+        self.body_offset = body_offset
+
+def parse_http(data, start=0, end=None):
+    """
+    Returns HTTPHead for data[start:end] starting with HTTP request line or status line (None otherwise)
+
+    Note: only the head gets copied out of data (e.g. TCP payload parsed in place inside of frame)
+    """
+
+    if end is None:
+        end = len(data)
+
+    index = data.find("\r\n", start, end)
+    line = data[start:index] if index >= 0 else None
+    method = path = version = None
+
+    if data.startswith("HTTP/", start, end):
+        response = True
+    elif line and line.count(' ') == 2 and " HTTP/" in line:
+        response = False
+        method, path, version = line.split(' ')
+    else:
+        return None
+
+    index = data.find(HTTP_HEAD_SEPARATOR, start, end)
+
+    if index >= 0:
+        head, body_offset = data[start:index], index + len(HTTP_HEAD_SEPARATOR)
+        lines = head.split("\r\n")
+    else:
+        # Note: last line of truncated head is incomplete
+        head, body_offset = data[start:end], None
+        lines = head.split("\r\n")[:-1]
+
+    headers = {}
+
+    for line in lines[1:]:
+        name, colon, value = line.partition(':')
+        if colon:
+            name = name.lower()
+            if name not in headers:
+                headers[name] = value.strip()
+
+    return HTTPHead(response, method, path, version, head, headers, body_offset)
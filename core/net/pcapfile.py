@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) 2018-present Jasper De Moor (@DeMoorJasper)
+See the file 'LICENSE' for copying permission
+"""
+
+# Memory mapped pcap/pcapng reader (Reference: https://wiki.wireshark.org/Development/LibpcapFileFormat, https://github.com/pcapng/pcapng)
+
+import mmap
+import struct
+
+# magic: (byte order, divisor of sub-second timestamp part to get microseconds)
+PCAP_MAGICS = { "\xd4\xc3\xb2\xa1": ('<', 1), "\xa1\xb2\xc3\xd4": ('>', 1), "\x4d\x3c\xb2\xa1": ('<', 1000), "\xa1\xb2\x3c\x4d": ('>', 1000) }
+PCAP_HEADER_LENGTH = 24
+PCAP_RECORD_HEADER_LENGTH = 16
+
+PCAPNG_MAGIC = "\x0a\x0d\x0d\x0a"
+PCAPNG_BYTE_ORDER_MAGICS = { "\x4d\x3c\x2b\x1a": '<', "\x1a\x2b\x3c\x4d": '>' }
+PCAPNG_SECTION_HEADER_BLOCK = 0x0a0d0d0a
+PCAPNG_INTERFACE_DESCRIPTION_BLOCK = 1
+PCAPNG_PACKET_BLOCK = 2
+PCAPNG_SIMPLE_PACKET_BLOCK = 3
+PCAPNG_ENHANCED_PACKET_BLOCK = 6
+PCAPNG_OPTION_IF_TSRESOL = 9
+
+class CaptureFile(object):
+    """
+    Capture file which can be split into independent chunks (for parallel processing)
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+
+        with open(filename, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic = self.mmap[:4]
+
+        if magic in PCAP_MAGICS:
+            self.pcapng = False
+            self.byte_order, self.divisor = PCAP_MAGICS[magic]
+            self.datalink = struct.unpack_from("%sI" % self.byte_order, self.mmap, 20)[0]
+        elif magic == PCAPNG_MAGIC:
+            self.pcapng = True
+        else:
+            raise ValueError("unsupported capture file format ('%s')" % filename)
+
+    def close(self):
+        self.mmap.close()
+
+    def split(self, chunk_size):
+        """
+        Returns list of (start, end, state) chunks of approximately chunk_size bytes
+        (state being whatever is needed to start parsing in the middle of file)
+        """
+
+        retval = []
+        size = len(self.mmap)
+
+        if not self.pcapng:
+            header = struct.Struct("%s8xI" % self.byte_order)
+            start = offset = PCAP_HEADER_LENGTH
+
+            while offset + PCAP_RECORD_HEADER_LENGTH <= size:
+                if offset - start >= chunk_size:
+                    retval.append((start, offset, None))
+                    start = offset
+                offset += PCAP_RECORD_HEADER_LENGTH + header.unpack_from(self.mmap, offset)[0]
+
+            retval.append((start, size, None))
+        else:
+            byte_order, interfaces = None, []
+            start, state, offset = 0, (None, []), 0
+
+            while offset + 12 <= size:
+                if offset - start >= chunk_size:
+                    retval.append((start, offset, state))
+                    start, state = offset, (byte_order, list(interfaces))
+
+                block_type = self.mmap[offset:offset + 4]
+
+                if block_type == PCAPNG_MAGIC:
+                    byte_order = PCAPNG_BYTE_ORDER_MAGICS[self.mmap[offset + 8:offset + 12]]
+                    interfaces = []
+                elif struct.unpack_from("%sI" % byte_order, self.mmap, offset)[0] == PCAPNG_INTERFACE_DESCRIPTION_BLOCK:
+                    interfaces.append(self._interface(byte_order, offset))
+
+                offset += self._block_length(byte_order, offset)
+
+            retval.append((start, size, state))
+
+        return retval
+
+    def _block_length(self, byte_order, offset):
+        """
+        Returns length of pcapng block at given offset (raising ValueError if it's invalid, e.g. in truncated or corrupted file)
+        """
+
+        retval = struct.unpack_from("%sI" % byte_order, self.mmap, offset + 4)[0]
+
+        if retval < 12 or retval % 4 or offset + retval > len(self.mmap):
+            raise ValueError("invalid block length %d at offset %d of capture file '%s'" % (retval, offset, self.filename))
+
+        return retval
+
+    def _interface(self, byte_order, offset):
+        """
+        Returns (datalink, timestamp units per second) out of pcapng interface description block
+        """
+
+        datalink = struct.unpack_from("%sH" % byte_order, self.mmap, offset + 8)[0]
+        resolution = 10 ** 6
+        end = offset + struct.unpack_from("%sI" % byte_order, self.mmap, offset + 4)[0] - 4
+        offset += 16
+
+        while offset + 4 <= end:
+            code, length = struct.unpack_from("%sHH" % byte_order, self.mmap, offset)
+            if code == 0:
+                break
+            elif code == PCAPNG_OPTION_IF_TSRESOL:
+                value = ord(self.mmap[offset + 4])
+                resolution = 2 ** (value & 0x7f) if value & 0x80 else 10 ** value
+            offset += 4 + (length + 3) / 4 * 4
+
+        return (datalink, resolution)
+
+    def packets(self, start=None, end=None, state=None):
+        """
+        Yields (datalink, sec, usec, frame) for all packets between start and end offsets
+        """
+
+        if not self.pcapng:
+            return self._pcap_packets(PCAP_HEADER_LENGTH if start is None else start, len(self.mmap) if end is None else end)
+        else:
+            return self._pcapng_packets(start or 0, len(self.mmap) if end is None else end, state or (None, []))
+
+    def _pcap_packets(self, offset, end):
+        header = struct.Struct("%sIII" % self.byte_order)
+        datalink, divisor = self.datalink, self.divisor
+
+        while offset + PCAP_RECORD_HEADER_LENGTH <= end:
+            sec, subsec, length = header.unpack_from(self.mmap, offset)
+            offset += PCAP_RECORD_HEADER_LENGTH
+            yield (datalink, sec, subsec / divisor, self.mmap[offset:offset + length])
+            offset += length
+
+    def _pcapng_packets(self, offset, end, state):
+        byte_order, interfaces = state[0], list(state[1])
+
+        while offset + 12 <= end:
+            if self.mmap[offset:offset + 4] == PCAPNG_MAGIC:
+                byte_order = PCAPNG_BYTE_ORDER_MAGICS[self.mmap[offset + 8:offset + 12]]
+                interfaces = []
+
+            block_type, block_length = struct.unpack_from("%sI" % byte_order, self.mmap, offset)[0], self._block_length(byte_order, offset)
+
+            if block_type == PCAPNG_INTERFACE_DESCRIPTION_BLOCK:
+                interfaces.append(self._interface(byte_order, offset))
+            elif block_type in (PCAPNG_ENHANCED_PACKET_BLOCK, PCAPNG_PACKET_BLOCK):
+                if block_type == PCAPNG_ENHANCED_PACKET_BLOCK:
+                    interface, high, low, length = struct.unpack_from("%sIIII" % byte_order, self.mmap, offset + 8)
+                else:
+                    interface, high, low, length = struct.unpack_from("%sHxxIII" % byte_order, self.mmap, offset + 8)
+                datalink, resolution = interfaces[interface]
+                timestamp = (high << 32) | low
+                yield (datalink, int(timestamp / resolution), int(timestamp % resolution * 10 ** 6 / resolution), self.mmap[offset + 28:offset + 28 + length])
+            elif block_type == PCAPNG_SIMPLE_PACKET_BLOCK:
+                datalink, _ = interfaces[0]
+                length = min(struct.unpack_from("%sI" % byte_order, self.mmap, offset + 8)[0], block_length - 16)
+                yield (datalink, 0, 0, self.mmap[offset + 12:offset + 12 + length])
+
+            offset += block_length
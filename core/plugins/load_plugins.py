@@ -1,5 +1,8 @@
+import socket
+import sys
 import core.logger as logger
 
+from core.events.Event import SEVERITY
 from core.plugins.plugin_utils import find_plugin
 from core.plugins.plugin_utils import validate_plugin
 from core.plugins.plugin_utils import load_plugin
@@ -26,3 +29,69 @@ def load_plugins(plugins):
         logger.info("Plugin initialised:", plugin)
 
     return plugin_functions
+
+def build_capture_filter(plugin_functions):
+    """
+    Composes capture (BPF) filter out of traffic declared by loaded plugins (through
+    module attribute '__filter__'). Returns None if any of plugins needs all traffic
+    """
+
+    filters = []
+
+    for (plugin, function) in plugin_functions:
+        _ = getattr(sys.modules[function.__module__], "__filter__", None)
+
+        if not _:
+            logger.info("plugin '%s' doesn't declare '__filter__' (all traffic required)" % plugin)
+            return None
+
+        if _ not in filters:
+            filters.append(_)
+
+    if not filters:
+        return None
+
+    retval = " or ".join("(%s)" % _ for _ in filters)
+
+    # Note: IPv6 and MPLS traffic is passed whole (plugin filters use IPv4 only primitives like 'tcp[tcpflags]'), while
+    # VLAN tagged traffic is filtered after the tag ('vlan' shifts offsets of all primitives after it, hence it goes last)
+    return "%s or ip6 or mpls or (vlan and (%s or ip6 or mpls or vlan))" % (retval, retval)
+
+def build_dispatch_table(plugin_functions):
+    """
+    Builds table of plugins per IP protocol (and per TCP flags byte) out of traffic declared by loaded plugins
+    (through module attributes '__protocols__', '__tcp_flags__' and '__ports__'). Plugins without declarations
+    get all packets, while key None holds plugins for protocols not declared by any of plugins
+
+    Entries are (plugin, function, ports, max_severity, max_accuracy), ordered by declared '__priority__' (highest first)
+
+    Note: '__tcp_flags__' is either (mask, value) pair (i.e. flags & mask == value) or function over flags byte
+    """
+
+    retval = {}
+    declarations = []
+    protocols = set((socket.IPPROTO_TCP,))
+
+    for (plugin, function) in sorted(plugin_functions, key=lambda _: -getattr(sys.modules[_[1].__module__], "__priority__", 0)):
+        module = sys.modules[function.__module__]
+        ports = getattr(module, "__ports__", None)
+        tcp_flags = getattr(module, "__tcp_flags__", None)
+
+        if isinstance(tcp_flags, tuple):
+            tcp_flags = (lambda mask, value: lambda flags: flags & mask == value)(*tcp_flags)
+
+        entry = (plugin, function, frozenset(ports) if ports else None, getattr(module, "__max_severity__", SEVERITY.VERY_HIGH), getattr(module, "__max_accuracy__", 100))
+        declarations.append((entry, getattr(module, "__protocols__", None), tcp_flags))
+        protocols.update(getattr(module, "__protocols__", None) or ())
+
+    retval[None] = tuple(entry for entry, declared, _ in declarations if declared is None)
+
+    for protocol in protocols:
+        candidates = [(entry, tcp_flags) for entry, declared, tcp_flags in declarations if declared is None or protocol in declared]
+
+        if protocol == socket.IPPROTO_TCP:
+            retval[protocol] = [tuple(entry for entry, tcp_flags in candidates if tcp_flags is None or tcp_flags(flags)) for flags in xrange(256)]
+        else:
+            retval[protocol] = tuple(entry for entry, _ in candidates)
+
+    return retval
@@ -1,5 +1,7 @@
+import sys
 import core.logger as logger
 
+from core.events.Event import Event
 from core.plugins.plugin_utils import find_plugin
 from core.plugins.plugin_utils import validate_plugin
 from core.plugins.plugin_utils import load_plugin
@@ -24,6 +26,11 @@ def load_triggers(triggers):
             exit("missing function 'trigger(event)' in trigger script '%s'" % filename)
             
         trigger_functions.append(trigger_tuple)
+
+        # Note: packet (payload) is kept inside of events only if some trigger asks for it
+        if getattr(sys.modules[trigger_tuple[1].__module__], "__payload__", False):
+            Event.keep_packet = True
+
         logger.info("Trigger initialised:", trigger)
 
     return trigger_functions
@@ -1,5 +1,8 @@
 import traceback
+import socket
 import struct
+import time
+import core.profiler as profiler
 
 from core.net.Packet import Packet
 from core.cache import checkCache
@@ -8,43 +11,78 @@ from core.settings import config
 
 ACCURACY_MARGIN = 25
 
-def process_packet(decodedFrame, sec, usec):
+def _beats(event, severity, accuracy):
+    """
+    Returns True if event with given severity and accuracy should be emitted instead of given event
+    """
+
+    severity_difference = event.severity - severity
+    accuracy_difference = event.accuracy - accuracy
+
+    return ((severity_difference == 0 and accuracy_difference < 0) or
+            (severity_difference < 0 and accuracy_difference - ACCURACY_MARGIN < 0) or
+            (severity_difference > 0 and accuracy_difference < ACCURACY_MARGIN))
+
+def _can_beat(event, max_severity, max_accuracy):
+    """
+    Returns True if plugin producing events up to given severity and accuracy could beat given event
+    """
+
+    if (max_severity > 0 or event.severity != 0) and event.accuracy - max_accuracy < ACCURACY_MARGIN:  # any other severity
+        return True
+
+    return event.severity <= max_severity and max_accuracy > event.accuracy  # same severity
+
+def process_packet(frame, sec, usec, datalink):
     checkCache()
 
+    profile = config.USE_PROFILER
+    start = time.time() if profile else None
+
     try:
-        packet = Packet(decodedFrame, sec, usec)
+        packet = Packet(frame, sec, usec, datalink)
 
-        # TODO: Add ability to detect non-ip attacks
-        if not hasattr(packet, 'ip'):
-            return
+        if profile:
+            decoded = time.time()
+            profiler.record(profiler.STAGE, "decode", decoded - start)
 
+        # TODO: Add ability to detect non-ip attacks
         # This is not an IP package
         if packet.ip_version is None or packet.is_empty:
             return
 
-        # Run through all the plugins
-        if config.plugin_functions:
-            events = []
-            for (plugin, function) in config.plugin_functions:
-                try:
-                    event = function(packet, config, trails)
-                    if event:
-                        events.append(event)
-                except Exception:
-                    if config.SHOW_DEBUG:
-                        traceback.print_exc()
-
-            if (len(events) > 0):
-                emitted_event = events[0]
-                for event in events:
-                    severity_difference = emitted_event.severity - event.severity
-                    accuracy_difference = emitted_event.accuracy - event.accuracy
-                    if ((severity_difference == 0 and accuracy_difference < 0) or 
-                        (severity_difference < 0 and accuracy_difference - ACCURACY_MARGIN < 0) or 
-                        (severity_difference > 0 and accuracy_difference < ACCURACY_MARGIN)):
-                        emitted_event = event
-
-                return emitted_event
+        # Run through plugins handling this kind of packet (all plugins if there is no dispatch table)
+        if config.plugin_dispatch:
+            plugins = config.plugin_dispatch.get(packet.protocol, config.plugin_dispatch[None])
+
+            if packet.protocol == socket.IPPROTO_TCP:
+                plugins = plugins[packet.tcp[5]]
+        else:
+            plugins = [(plugin, function, None, None, None) for (plugin, function) in config.plugin_functions or ()]
+
+        emitted_event = None
+
+        for (plugin, function, ports, max_severity, max_accuracy) in plugins:
+            if ports and packet.src_port not in ports and packet.dst_port not in ports:
+                continue
+
+            # Skip plugins which can't produce anything better than already found event
+            if emitted_event and max_severity is not None and not _can_beat(emitted_event, max_severity, max_accuracy):
+                continue
+
+            try:
+                event = function(packet, config, trails)
+                if event and (emitted_event is None or _beats(emitted_event, event.severity, event.accuracy)):
+                    emitted_event = event
+            except Exception:
+                if config.SHOW_DEBUG:
+                    traceback.print_exc()
+
+        if profile:
+            profiler.record(profiler.STAGE, "plugins", time.time() - decoded)
+            profiler.report()
+
+        return emitted_event
 
     except struct.error:
         pass
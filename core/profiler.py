@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+
+import bisect
+import functools
+import json
+import multiprocessing
+import os
+import Queue
+import time
+
+from core.settings import config
+from core.settings import PROFILER_REPORT_INTERVAL
+
+PLUGIN, TRIGGER, STAGE = "plugins", "triggers", "stages"
+PERCENTILES = (50, 90, 99)
+
+# Upper bounds (in microseconds) of execution time histogram buckets (percentiles are estimated out of them)
+TIME_BUCKETS = tuple(int(1.5 ** _) for _ in xrange(1, 41))
+
+stats_queue = multiprocessing.Queue()
+
+_stats = {}
+_snapshots = {}
+_last_report = time.time()
+_reporting = True
+
+class Stats(object):
+    """
+    Execution statistics of a single plugin, trigger or processing stage
+    """
+
+    __slots__ = ("calls", "time", "events", "exceptions", "histogram")
+
+    def __init__(self):
+        self.calls = 0
+        self.time = 0.0
+        self.events = 0
+        self.exceptions = 0
+        self.histogram = [0] * (len(TIME_BUCKETS) + 1)
+
+    def add(self, elapsed, events=0, exceptions=0):
+        self.calls += 1
+        self.time += elapsed
+        self.events += events
+        self.exceptions += exceptions
+        self.histogram[bisect.bisect_left(TIME_BUCKETS, elapsed * 1000000)] += 1
+
+    def state(self):
+        return (self.calls, self.time, self.events, self.exceptions, list(self.histogram))
+
+    def merge(self, state):
+        calls, time_, events, exceptions, histogram = state
+        self.calls += calls
+        self.time += time_
+        self.events += events
+        self.exceptions += exceptions
+        self.histogram = [a + b for a, b in zip(self.histogram, histogram)]
+
+    def percentile(self, value):
+        """
+        Returns (upper bound of) given percentile of execution time in microseconds
+        """
+
+        threshold = self.calls * value / 100.0
+        total = 0
+
+        for i, count in enumerate(self.histogram):
+            total += count
+            if total and total >= threshold:
+                return TIME_BUCKETS[min(i, len(TIME_BUCKETS) - 1)]
+
+        return 0
+
+    def to_dict(self):
+        retval = { "calls": self.calls, "time": round(self.time, 6), "events": self.events, "exceptions": self.exceptions }
+
+        for _ in PERCENTILES:
+            retval["p%d_us" % _] = self.percentile(_)
+
+        return retval
+
+def record(kind, name, elapsed, events=0, exceptions=0):
+    key = (kind, name)
+
+    if key not in _stats:
+        _stats[key] = Stats()
+
+    _stats[key].add(elapsed, events, exceptions)
+
+def profiled(kind, functions):
+    """
+    Returns (name, function) pairs with functions wrapped for recording of their execution statistics
+    """
+
+    def _wrap(function):
+        name = function.func_name
+
+        @functools.wraps(function)
+        def _(*args):
+            start = time.time()
+
+            try:
+                retval = function(*args)
+            except Exception:
+                record(kind, name, time.time() - start, exceptions=1)
+                raise
+
+            # Note: plugins count produced events, while triggers count handled ones
+            record(kind, name, time.time() - start, events=1 if retval or kind == TRIGGER else 0)
+
+            return retval
+
+        return _
+
+    return [(name, _wrap(function)) for (name, function) in functions or ()]
+
+def disable_reports():
+    """
+    Disables reporting through stats_queue (pool workers forked afterwards pass statistics with their results)
+
+    Note: main process drains stats_queue only while dumping, hence exiting pool workers could block on it
+    """
+
+    global _reporting
+
+    _reporting = False
+
+def take():
+    """
+    Returns (and resets) statistics of current process (e.g. to be returned by pool worker with its result)
+    """
+
+    retval = dict((key, value.state()) for key, value in _stats.items())
+    _stats.clear()
+
+    return retval
+
+def merge(snapshot):
+    """
+    Merges statistics returned by take() (inside of other process) into the ones of current process
+    """
+
+    for key, state in (snapshot or {}).items():
+        if key not in _stats:
+            _stats[key] = Stats()
+
+        _stats[key].merge(state)
+
+def report(force=False):
+    """
+    Passes (cumulative) statistics of worker process to the main one (every PROFILER_REPORT_INTERVAL seconds)
+    """
+
+    global _last_report
+
+    if _reporting and (force or time.time() - _last_report >= PROFILER_REPORT_INTERVAL):
+        _last_report = time.time()
+
+        if multiprocessing.current_process().name != "MainProcess":
+            stats_queue.put((os.getpid(), dict((key, value.state()) for key, value in _stats.items())))
+
+def collect():
+    """
+    Returns statistics merged over all processes ({kind: {name: Stats}})
+    """
+
+    while True:
+        try:
+            pid, snapshot = stats_queue.get_nowait()
+            _snapshots[pid] = snapshot
+        except Queue.Empty:
+            break
+
+    retval = {}
+
+    for snapshot in [dict((key, value.state()) for key, value in _stats.items())] + _snapshots.values():
+        for (kind, name), state in snapshot.items():
+            retval.setdefault(kind, {}).setdefault(name, Stats()).merge(state)
+
+    return retval
+
+def dump(log, counters=None):
+    """
+    Logs collected statistics (with given logging function) and stores them into PROFILER_STATS_FILE (if set)
+    """
+
+    stats = collect()
+
+    for kind in (STAGE, PLUGIN, TRIGGER):
+        for name, value in sorted(stats.get(kind, {}).items(), key=lambda _: -_[1].time):
+            log("%s (%s): %d CALLS | %.3f s TOTAL | %s us P%s | %d EVENTS | %d EXCEPTIONS" % (kind[:-1].upper(), name, value.calls, value.time, '/'.join(str(value.percentile(_)) for _ in PERCENTILES), '/'.join(str(_) for _ in PERCENTILES), value.events, value.exceptions))
+
+    if config.PROFILER_STATS_FILE:
+        content = { "time": int(time.time()), "counters": counters or {} }
+
+        for kind in (STAGE, PLUGIN, TRIGGER):
+            content[kind] = dict((name, value.to_dict()) for name, value in stats.get(kind, {}).items())
+
+        try:
+            with open("%s.tmp" % config.PROFILER_STATS_FILE, "w+b") as f:
+                json.dump(content, f, indent=2, sort_keys=True)
+
+            os.rename("%s.tmp" % config.PROFILER_STATS_FILE, config.PROFILER_STATS_FILE)
+        except (IOError, OSError), ex:
+            log("unable to write stats file '%s' ('%s')" % (config.PROFILER_STATS_FILE, ex))
@@ -23,6 +23,7 @@ from core.trails.trailsdict import TrailsDict
 
 config = AttribDict()
 trails = TrailsDict()
+trails_generation = multiprocessing.Value('L', 0)  # generation of (snapshot backed) trails announced by main process to workers
 
 NAME = "Maltrail"
 VERSION = "0.10.475"
@@ -31,8 +32,12 @@ DATE_FORMAT = "%Y-%m-%d"
 ROTATING_CHARS = ('\\', '|', '|', '/', '-')
 TIMEOUT = 30
 FRESH_IPCAT_DELTA_DAYS = 10
+FEED_FETCH_THREADS = 10
+FEED_FETCH_TIMEOUT = 10 * TIMEOUT  # s (per feed, which might retrieve multiple resources)
+FEED_UPDATE_TIMEOUT = 20 * 60  # s (all feeds)
 USERS_DIR = os.path.join(os.path.expanduser("~"), ".%s" % NAME.lower())
 TRAILS_FILE = os.path.join(USERS_DIR, "trails.csv")
+TRAILS_SNAPSHOT_FILE = os.path.join(USERS_DIR, "trails.bin")
 IPCAT_CSV_FILE = os.path.join(USERS_DIR, "ipcat.csv")
 IPCAT_SQLITE_FILE = os.path.join(USERS_DIR, "ipcat.sqlite")
 IPCAT_URL = "https://raw.githubusercontent.com/client9/ipcat/master/datacenters.csv"
@@ -44,20 +49,30 @@ HTTP_TIME_FORMAT = "%a, %d %b %Y %H:%M:%S GMT"  # Reference: http://stackoverflo
 CEF_FORMAT = "{syslog_time} {host} CEF:0|{device_vendor}|{device_product}|{device_version}|{signature_id}|{name}|{severity}|{extension}"
 SESSION_COOKIE_NAME = "%s_sessid" % NAME.lower()
 SNAP_LEN = 2000
-BLOCK_LENGTH = 1 + 2 + 4 + 4 + 4 + SNAP_LEN  # primitive mutex + short for packet size + int for sec + int for usec + int for IP offset + max packet size
+BLOCK_LENGTH = 1 + 2 + 4 + 4 + 4 + SNAP_LEN  # primitive mutex + short for packet size + int for sec + int for usec + int for datalink + max packet size
 SHORT_SENSOR_SLEEP_TIME = 0.00001
 REGULAR_SENSOR_SLEEP_TIME = 0.001
+PACKET_BATCH_SIZE = 64
+PACKET_BATCH_TIMEOUT = 0.1  # s
+OVERFLOW_SAMPLE_RATE = 10
+OFFLINE_CHUNK_SIZE = 32 * 1024 * 1024
+WATCH_POLL_INTERVAL = 5  # s
+WATCH_SETTLE_TIME = 60  # s
+WATCH_CHECKPOINT_FILE = ".maltrail_checkpoint"
+PROFILER_REPORT_INTERVAL = 5  # s
 LOAD_TRAILS_RETRY_SLEEP_TIME = 60
 UNAUTHORIZED_SLEEP_TIME = 5
 NO_SUCH_NAME_PER_HOUR_THRESHOLD = 20
 NO_BLOCK = -1
 END_BLOCK = -2
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+WHITELIST_FILE = os.path.join(ROOT_DIR, "misc", "whitelist.txt")
 HTML_DIR = os.path.join(ROOT_DIR, "html")
 DISPOSED_NONCES = set()
 PING_RESPONSE = "pong"
 MAX_NOFILE = 65000
 CAPTURE_TIMEOUT = 100  # ms
+AF_PACKET_RING_SIZE = 64 * 1024 * 1024
 CONFIG_FILE = os.path.join(ROOT_DIR, "maltrail.conf")
 SYSTEM_LOG_DIR = "/var/log"
 HOSTNAME = socket.gethostname()
@@ -106,7 +121,7 @@ WHITELIST_HTTP_REQUEST_PATHS = ("fql", "yql", "ads", "../images/", "../themes/",
 WHITELIST_UA_KEYWORDS = ("AntiVir-NGUpd", "TMSPS", "AVGSETUP", "SDDS", "Sophos", "Symantec", "internal dummy connection")
 WHITELIST_LONG_DOMAIN_NAME_KEYWORDS = ("blogspot",)
 SESSIONS = {}
-NO_SUCH_NAME_COUNTERS = {}  # this won't be (expensive) shared in multiprocessing run (hence, the threshold will effectively be n-times higher)
+NO_SUCH_NAME_COUNTERS = {}  # this won't be (expensive) shared in multiprocessing run (DNS traffic is routed to workers by resolver address, hence the threshold holds per resolver)
 SESSION_ID_LENGTH = 16
 SESSION_EXPIRATION_HOURS = 24
 IPPROTO_LUT = dict(((getattr(socket, _), _.replace("IPPROTO_", "")) for _ in dir(socket) if _.startswith("IPPROTO_")))
@@ -226,7 +241,7 @@ def read_whitelist():
     WHITELIST.clear()
     WHITELIST_RANGES.clear()
 
-    _ = os.path.abspath(os.path.join(ROOT_DIR, "misc", "whitelist.txt"))
+    _ = WHITELIST_FILE
     if os.path.isfile(_):
         with open(_, "r") as f:
             for line in f:
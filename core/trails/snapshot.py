@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) 2014-2018 Miroslav Stampar (@stamparm)
+See the file 'LICENSE' for copying permission
+"""
+
+# Binary (memory mapped) trails snapshot: open addressing hash table per trail type, with keys and
+# (info, reference) pairs kept inside of a string pool (pages are shared between all processes)
+
+import mmap
+import os
+import struct
+import zlib
+
+from core.trails.trailsdict import addr_key
+from core.trails.trailsdict import addr_value
+from core.trails.trailsdict import ip_key
+from core.trails.trailsdict import ip_value
+from core.trails.trailsdict import url_key
+
+SNAPSHOT_MAGIC = "MTSNAP02"
+SNAPSHOT_TABLES = ("trail", "ip4", "ip6", "addr4", "addr6", "url")
+SNAPSHOT_HEADER = struct.Struct("=8sQQQQI" + "QII" * len(SNAPSHOT_TABLES))  # magic, generation, source size, source mtime, pairs offset, pairs count, (slots offset, slot count, entry count) per table
+SNAPSHOT_SLOT = struct.Struct("=IIII")  # hash, key offset, key length, pair index + 1 (0 for empty slot)
+SNAPSHOT_PAIR = struct.Struct("=IIII")  # info offset, info length, reference offset, reference length
+
+IP4_KEY = struct.Struct("!I")
+IP6_KEY = struct.Struct("!QQ")
+ADDR4_KEY = struct.Struct("!IH")
+ADDR6_KEY = struct.Struct("!QQH")
+MASK64 = 0xffffffffffffffff
+
+_unpack_slot = SNAPSHOT_SLOT.unpack_from  # Note: slot size is 16 (i.e. offset of slot i is i << 4)
+
+def encode_key(key):
+    """
+    Returns (table, binary key) for given trail
+    """
+
+    _ = ip_key(key)
+
+    if _ is not None:
+        return ("ip4", IP4_KEY.pack(_[1])) if _[0] == 4 else ("ip6", IP6_KEY.pack(_[1] >> 64, _[1] & MASK64))
+
+    _ = addr_key(key) if ':' in key else None
+
+    if _ is not None:
+        version, (value, port) = _
+        return ("addr4", ADDR4_KEY.pack(value, port)) if version == 4 else ("addr6", ADDR6_KEY.pack(value >> 64, value & MASK64, port))
+
+    return ("url" if '/' in key else "trail"), key
+
+def decode_key(table, key):
+    if table == "ip4":
+        return ip_value(4, IP4_KEY.unpack(key)[0])
+    elif table == "ip6":
+        high, low = IP6_KEY.unpack(key)
+        return ip_value(6, high << 64 | low)
+    elif table == "addr4":
+        return addr_value(4, ADDR4_KEY.unpack(key))
+    elif table == "addr6":
+        high, low, port = ADDR6_KEY.unpack(key)
+        return addr_value(6, (high << 64 | low, port))
+    else:
+        return key
+
+def snapshot_generation(filename):
+    """
+    Returns generation of snapshot file (0 if there is no valid one)
+    """
+
+    try:
+        with open(filename, "rb") as f:
+            header = f.read(SNAPSHOT_HEADER.size)
+    except (IOError, OSError):
+        return 0
+
+    if len(header) == SNAPSHOT_HEADER.size and header.startswith(SNAPSHOT_MAGIC):
+        return SNAPSHOT_HEADER.unpack(header)[1]
+
+    return 0
+
+def write_snapshot(filename, trails, source=(0, 0)):
+    """
+    Writes trails (mapping of trail to (info, reference)) into snapshot file (atomically, through rename)
+    with generation being one more than the one of previous snapshot file
+
+    Note: source is (size, mtime) of file trails originate from (used for detection of stale snapshot)
+    """
+
+    pairs, reverse_pairs = [], {}
+    entries = dict((_, []) for _ in SNAPSHOT_TABLES)
+
+    for key in trails:
+        value = tuple(trails[key])
+
+        if value not in reverse_pairs:
+            reverse_pairs[value] = len(pairs)
+            pairs.append(value)
+
+        table, key = encode_key(key)
+        entries[table].append((key, reverse_pairs[value]))
+
+    pool = bytearray()
+    pool_offset = SNAPSHOT_HEADER.size
+
+    def _store(value):
+        offset = pool_offset + len(pool)
+        pool.extend(value)
+        return offset, len(value)
+
+    pair_records = bytearray()
+    for info, reference in pairs:
+        pair_records.extend(SNAPSHOT_PAIR.pack(*(_store(info) + _store(reference))))
+
+    slot_records = []
+    for table in SNAPSHOT_TABLES:
+        count = 1
+        while count < len(entries[table]) * 4 / 3 + 1:
+            count <<= 1
+
+        slots, taken, mask = bytearray(count * SNAPSHOT_SLOT.size), bytearray(count), count - 1
+
+        for key, pair in entries[table]:
+            hash_ = zlib.crc32(key) & 0xffffffff
+            i = hash_ & mask
+            while taken[i]:
+                i = (i + 1) & mask
+            taken[i] = 1
+            SNAPSHOT_SLOT.pack_into(slots, i * SNAPSHOT_SLOT.size, hash_, pool_offset + len(pool), len(key), pair + 1)
+            pool.extend(key)
+
+        slot_records.append((slots, count, len(entries[table])))
+
+    offset = pool_offset + len(pool)
+    header = [SNAPSHOT_MAGIC, snapshot_generation(filename) + 1, source[0], int(source[1]), offset, len(pairs)]
+    offset += len(pair_records)
+
+    for slots, count, entry_count in slot_records:
+        header.extend((offset, count, entry_count))
+        offset += len(slots)
+
+    try:
+        with open("%s.tmp" % filename, "w+b") as f:
+            f.write(SNAPSHOT_HEADER.pack(*header))
+            f.write(pool)
+            f.write(pair_records)
+            for slots, _, _ in slot_records:
+                f.write(slots)
+
+        os.rename("%s.tmp" % filename, filename)
+    except:
+        # Note: leftover (partially written) temporary file is removed
+        if os.path.exists("%s.tmp" % filename):
+            os.remove("%s.tmp" % filename)
+        raise
+
+class TrailsSnapshot(object):
+    """
+    Read only (memory mapped) trails snapshot with lookup methods of TrailsDict
+    """
+
+    def __init__(self, filename):
+        with open(filename, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.mmap) < SNAPSHOT_HEADER.size or self.mmap[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            self.mmap.close()
+            raise ValueError("invalid trails snapshot file '%s'" % filename)
+
+        header = SNAPSHOT_HEADER.unpack_from(self.mmap, 0)
+        self.generation = header[1]
+        self.source = header[2:4]
+        self._tables = {}
+
+        for i, table in enumerate(SNAPSHOT_TABLES):
+            offset, count, entry_count = header[6 + 3 * i:9 + 3 * i]
+            self._tables[table] = (offset, count - 1, entry_count)
+
+        self._pairs = []
+
+        for i in xrange(header[5]):
+            info_offset, info_length, reference_offset, reference_length = SNAPSHOT_PAIR.unpack_from(self.mmap, header[4] + i * SNAPSHOT_PAIR.size)
+            self._pairs.append((self.mmap[info_offset:info_offset + info_length], self.mmap[reference_offset:reference_offset + reference_length]))
+
+    def _lookup(self, table, key, suffix=""):
+        """
+        Returns (info, reference) stored under binary key (concatenated with suffix) inside of given table
+        """
+
+        offset, mask, _ = self._tables[table]
+        hash_ = (zlib.crc32(suffix, zlib.crc32(key)) if suffix else zlib.crc32(key)) & 0xffffffff
+        length = len(key) + len(suffix)
+        i = hash_ & mask
+
+        while True:
+            slot_hash, key_offset, key_length, pair = _unpack_slot(self.mmap, offset + (i << 4))
+
+            if not pair:
+                return None
+
+            if slot_hash == hash_ and key_length == length and self.mmap[key_offset:key_offset + length] == (key + suffix if suffix else key):
+                return self._pairs[pair - 1]
+
+            i = (i + 1) & mask
+
+    def __iter__(self):
+        for table in SNAPSHOT_TABLES:
+            offset, mask, _ = self._tables[table]
+
+            for i in xrange(mask + 1):
+                _, key_offset, key_length, pair = SNAPSHOT_SLOT.unpack_from(self.mmap, offset + i * SNAPSHOT_SLOT.size)
+
+                if pair:
+                    yield decode_key(table, self.mmap[key_offset:key_offset + key_length])
+
+    def __len__(self):
+        return sum(_[2] for _ in self._tables.values())
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        retval = self.get(key)
+
+        if retval is None:
+            raise KeyError(key)
+
+        return retval
+
+    def get(self, key, default=None):
+        retval = self._lookup(*encode_key(key))
+        return default if retval is None else retval
+
+    def get_ip(self, value, version=4):
+        if version == 4:
+            return self._lookup("ip4", IP4_KEY.pack(value))
+        else:
+            return self._lookup("ip6", IP6_KEY.pack(value >> 64, value & MASK64))
+
+    def get_addr(self, value, port, version=4):
+        if version == 4:
+            return self._lookup("addr4", ADDR4_KEY.pack(value, port))
+        else:
+            return self._lookup("addr6", ADDR6_KEY.pack(value >> 64, value & MASK64, port))
+
+    def get_url(self, host, path):
+        _ = url_key(host, path)
+        return self._lookup("url", *_) if _ is not None else None
+
+    def find_domains(self, query):
+        index = 0
+
+        while True:
+            domain = query[index:] if index else query
+            _ = self._lookup("trail", domain)
+
+            if _ is not None:
+                yield domain, _
+
+            index = query.find('.', index) + 1
+
+            if not index:
+                break
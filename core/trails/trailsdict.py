@@ -6,88 +6,331 @@ See the file 'LICENSE' for copying permission
 """
 
 import re
+import socket
+import struct
+
+IPV4_REGEX = re.compile(r"\A\d+\.\d+\.\d+\.\d+\Z")
+
+def ip_key(value):
+    """
+    Returns (ip_version, integer) for trail being an IPv4/IPv6 address (None otherwise)
+    """
+
+    if value[:1].isdigit() and IPV4_REGEX.match(value):
+        retval = 0
+
+        for _ in value.split('.'):
+            # Note: only canonical form (e.g. "010.0.0.1" is kept as a string)
+            if len(_) > 1 and _[0] == '0' or int(_) > 255:
+                return None
+            retval = retval << 8 | int(_)
+
+        return 4, retval
+    elif ':' in value:
+        try:
+            high, low = struct.unpack("!QQ", socket.inet_pton(socket.AF_INET6, value))
+            return 6, high << 64 | low
+        except (socket.error, ValueError):
+            pass
+
+    return None
+
+def ip_value(version, value):
+    if version == 4:
+        return socket.inet_ntoa(struct.pack("!I", value))
+    else:
+        return socket.inet_ntop(socket.AF_INET6, struct.pack("!QQ", value >> 64, value & 0xffffffffffffffff))
+
+def addr_key(value):
+    """
+    Returns (ip_version, (integer, port)) for trail being an address with port (e.g. "1.2.3.4:80" or "[2001:db8::1]:80"), None otherwise
+    """
+
+    if value.startswith('['):
+        host, separator, port = value[1:].partition("]:")
+    else:
+        host, separator, port = value.rpartition(':')
+
+    if separator and port.isdigit() and port == str(int(port)) and int(port) < 65536:
+        _ = ip_key(host)
+
+        if _ is not None and (_[0] == 6) == value.startswith('['):
+            return _[0], (_[1], int(port))
+
+    return None
+
+def url_key(host, path):
+    """
+    Returns (host, path) of URL trail host + path, split at its first '/' (as stored by TrailsDict), None if there is no '/'
+    """
+
+    if '/' not in host and path[:1] == '/':
+        return host, path
+
+    value = "%s%s" % (host, path)
+    index = value.find('/')
+
+    return (value[:index], value[index:]) if index >= 0 else None
+
+def addr_value(version, value):
+    return ("%s:%d" if version == 4 else "[%s]:%d") % (ip_value(version, value[0]), value[1])
 
 class TrailsDict(dict):
+    """
+    Trails storage partitioned by trail type: IP addresses (keyed by integer address), addresses with port
+    (keyed by (integer, port)), URLs (keyed by host and then by path) and domains (along with anything else)
+
+    Note: each trail maps to integer index of its (info, reference) pair, shared between all trails having
+    the same one (i.e. no per-trail value objects and no allocation on lookup)
+
+    Note: with attached (memory mapped) snapshot, all lookups are served by it (modification copies it over first)
+    """
+
     def __init__(self):
+        self._snapshot = None
+        self._reset()
+
+    def _reset(self):
         self._trails = {}
-        self._infos = []
-        self._reverse_infos = {}
-        self._references = []
-        self._reverse_references = {}
+        self._ips = {4: {}, 6: {}}
+        self._addrs = {4: {}, 6: {}}
+        self._urls = {}
+        self._pairs = []
+        self._reverse_pairs = {}
+
+    @property
+    def generation(self):
+        """
+        Generation of attached snapshot (None if there is none)
+        """
+
+        return self._snapshot.generation if self._snapshot is not None else None
+
+    def attach(self, snapshot):
+        """
+        Replaces content with given TrailsSnapshot (atomically, as lookups are served by it from the first statement on)
+        """
+
+        self._snapshot = snapshot
+        self._reset()
+
+    def replace(self, value):
+        """
+        Replaces content with given trails (without empty trails window in case of snapshot backed TrailsDict)
+        """
+
+        if isinstance(value, TrailsDict) and value._snapshot is not None:
+            self.attach(value._snapshot)
+        else:
+            self.clear()
+            self.update(value)
+
+    def _detach(self):
+        snapshot, self._snapshot = self._snapshot, None
+
+        for key in snapshot:
+            self[key] = snapshot[key]
+
+    def _find(self, key, create=False):
+        """
+        Returns storage holding given trail along with its key there
+        """
+
+        _ = ip_key(key)
+
+        if _ is not None:
+            return self._ips[_[0]], _[1]
+
+        _ = addr_key(key) if ':' in key else None
+
+        if _ is not None:
+            return self._addrs[_[0]], _[1]
+
+        _ = url_key(key, "") if '/' in key else None
+
+        if _ is not None:
+            host, path = _
+
+            if create and host not in self._urls:
+                self._urls[host] = {}
+
+            return self._urls.get(host, {}), path
+
+        return self._trails, key
 
     def __delitem__(self, key):
-        del self._trails[key]
+        if self._snapshot is not None:
+            self._detach()
+
+        storage, key = self._find(key)
+        del storage[key]
 
     def has_key(self, key):
-        return key in self._trails
+        return key in self
 
     def __contains__(self, key):
-        return key in self._trails
+        if self._snapshot is not None:
+            return key in self._snapshot
+
+        storage, key = self._find(key)
+        return key in storage
 
     def clear(self):
-        self._trails.clear()
-        self._infos = []
-        self._references = []
+        self._snapshot = None
+        self._reset()
 
     def keys(self):
-        return self._trails.keys()
+        return list(self)
 
     def iterkeys(self):
-        for key in self._trails.keys():
-            yield key
+        return iter(self)
 
     def __iter__(self):
+        if self._snapshot is not None:
+            for key in self._snapshot:
+                yield key
+            return
+
         for key in self._trails.keys():
             yield key
 
+        for version in self._ips:
+            for key in self._ips[version].keys():
+                yield ip_value(version, key)
+
+        for version in self._addrs:
+            for key in self._addrs[version].keys():
+                yield addr_value(version, key)
+
+        for host in self._urls.keys():
+            for path in self._urls[host].keys():
+                yield "%s%s" % (host, path)
+
     def get(self, key, default=None):
-        if key in self._trails:
-            _ = self._trails[key].split(',')
-            return (self._infos[int(_[0])], self._references[int(_[1])])
-        else:
+        if self._snapshot is not None:
+            return self._snapshot.get(key, default)
+
+        storage, key = self._find(key)
+
+        _ = storage.get(key)
+
+        if _ is None:
             return default
+        else:
+            return self._pairs[_]
+
+    def get_ip(self, value, version=4):
+        """
+        Returns (info, reference) for IP trail given as integer (e.g. packet.dst_ip_int), None if there is none
+        """
+
+        if self._snapshot is not None:
+            return self._snapshot.get_ip(value, version)
+
+        _ = self._ips[version].get(value)
+
+        if _ is not None:
+            return self._pairs[_]
+
+    def get_addr(self, value, port, version=4):
+        """
+        Returns (info, reference) for address trail given as integer and port, None if there is none
+        """
+
+        if self._snapshot is not None:
+            return self._snapshot.get_addr(value, port, version)
+
+        _ = self._addrs[version].get((value, port))
+
+        if _ is not None:
+            return self._pairs[_]
+
+    def get_url(self, host, path):
+        """
+        Returns (info, reference) for URL trail given as host (e.g. "" for path only trails) and path (starting with '/'), None if there is none
+        """
+
+        if self._snapshot is not None:
+            return self._snapshot.get_url(host, path)
+
+        _ = url_key(host, path)
+
+        if _ is None:
+            return None
+
+        host, path = _
+        _ = self._urls.get(host)
+
+        if _ is not None:
+            _ = _.get(path)
+
+            if _ is not None:
+                return self._pairs[_]
+
+    def find_domains(self, query):
+        """
+        Yields (domain, (info, reference)) for each domain trail matching given (lower case) query or its parent domain (longest first)
+        """
+
+        if self._snapshot is not None:
+            for _ in self._snapshot.find_domains(query):
+                yield _
+            return
+
+        index = 0
+
+        while True:
+            domain = query[index:] if index else query
+            _ = self._trails.get(domain)
+
+            if _ is not None:
+                yield domain, self._pairs[_]
+
+            index = query.find('.', index) + 1
+
+            if not index:
+                break
 
     def update(self, value):
         if isinstance(value, TrailsDict):
-            if not self._trails:
+            if not len(self):
                 for attr in dir(self):
-                    if re.search(r"\A_[a-z]", attr):
+                    if re.search(r"\A_[a-z]", attr) and not callable(getattr(value, attr)):
                         setattr(self, attr, getattr(value, attr))
             else:
                 for key in value:
                     self[key] = value[key]
         elif isinstance(value, dict):
             for key in value:
-                info, reference = value[key]
-                if info not in self._reverse_infos:
-                    self._reverse_infos[info] = len(self._infos)
-                    self._infos.append(info)
-                if reference not in self._reverse_references:
-                    self._reverse_references[reference] = len(self._references)
-                    self._references.append(reference)
-                self._trails[key] = "%d,%d" % (self._reverse_infos[info], self._reverse_references[reference])
+                self[key] = value[key]
         else:
             raise Exception("unsupported type '%s'" % type(value))
 
     def __len__(self):
-        return len(self._trails)
+        if self._snapshot is not None:
+            return len(self._snapshot)
+
+        return len(self._trails) + sum(len(_) for _ in self._ips.values()) + sum(len(_) for _ in self._addrs.values()) + sum(len(_) for _ in self._urls.values())
 
     def __getitem__(self, key):
-        if key in self._trails:
-            _ = self._trails[key].split(',')
-            return (self._infos[int(_[0])], self._references[int(_[1])])
-        else:
+        retval = self.get(key)
+
+        if retval is None:
             raise KeyError(key)
 
+        return retval
+
     def __setitem__(self, key, value):
         if isinstance(value, (tuple, list)):
+            value = tuple(value)
             info, reference = value
-            if info not in self._reverse_infos:
-                self._reverse_infos[info] = len(self._infos)
-                self._infos.append(info)
-            if reference not in self._reverse_references:
-                self._reverse_references[reference] = len(self._references)
-                self._references.append(reference)
-            self._trails[key] = "%d,%d" % (self._reverse_infos[info], self._reverse_references[reference])
+            if value not in self._reverse_pairs:
+                self._reverse_pairs[value] = len(self._pairs)
+                self._pairs.append(value)
+            if self._snapshot is not None:
+                self._detach()
+
+            storage, key = self._find(key, create=True)
+            storage[key] = self._reverse_pairs[value]
         else:
             raise Exception("unsupported type '%s'" % type(value))
@@ -9,10 +9,12 @@ import csv
 import glob
 import inspect
 import os
+import Queue
 import re
 import sqlite3
 import subprocess
 import sys
+import threading
 import time
 import urllib2
 
@@ -27,11 +29,16 @@ from core.net.addr import make_mask
 from core.common import bogon_ip
 from core.common import cdn_ip
 from core.common import check_whitelisted
+from core.common import chown_file
 from core.common import load_trails
+from core.common import store_trails_snapshot
 from core.common import retrieve_content
 from core.settings import config
 from core.settings import read_whitelist
 from core.settings import BAD_TRAIL_PREFIXES
+from core.settings import FEED_FETCH_THREADS
+from core.settings import FEED_FETCH_TIMEOUT
+from core.settings import FEED_UPDATE_TIMEOUT
 from core.settings import FRESH_IPCAT_DELTA_DAYS
 from core.settings import LOW_PRIORITY_INFO_KEYWORDS
 from core.settings import HIGH_PRIORITY_INFO_KEYWORDS
@@ -50,19 +57,80 @@ try:
 except (ImportError, AttributeError):
     pass
 
-def _chown(filepath):
-    if os.path.exists(filepath):
-        try:
-            os.chown(filepath, int(os.environ.get("SUDO_UID", -1)), int(os.environ.get("SUDO_GID", -1)))
-        except Exception, ex:
-            logger.error("chown problem with '%s' ('%s')" % (filepath, ex))
-
 def _fopen(filepath, mode="rb"):
     retval = open(filepath, mode)
     if "w+" in mode:
-        _chown(filepath)
+        chown_file(filepath)
     return retval
 
+class FeedTask(object):
+    """
+    Fetch of a single feed (run inside of a fetching thread)
+    """
+
+    def __init__(self, index, filename, module, function):
+        self.index = index
+        self.filename = filename
+        self.module = module
+        self.function = function
+        self.start = None
+        self.results = None
+        self.error = None
+        self.done = threading.Event()
+
+    def wait(self, deadline):
+        """
+        Waits for fetch to finish (returns False if it ran over FEED_FETCH_TIMEOUT or given overall deadline)
+        """
+
+        while not self.done.is_set():
+            now = time.time()
+            limit = min(deadline, (self.start or now) + FEED_FETCH_TIMEOUT)
+
+            if now >= limit:
+                return False
+
+            self.done.wait(limit - now)
+
+        return self.start is not None
+
+def fetch_feeds(tasks):
+    """
+    Fetches feeds with a bounded number of (daemon) threads and returns overall deadline (FEED_UPDATE_TIMEOUT)
+
+    Note: stalled fetches can't be interrupted, hence they are just abandoned by the caller
+    """
+
+    queue = Queue.Queue()
+    deadline = time.time() + FEED_UPDATE_TIMEOUT
+
+    def _worker():
+        while True:
+            try:
+                task = queue.get_nowait()
+            except Queue.Empty:
+                break
+
+            if time.time() < deadline:
+                task.start = time.time()
+
+                try:
+                    task.results = task.function()
+                except Exception, ex:
+                    task.error = ex
+
+            task.done.set()
+
+    for task in tasks:
+        queue.put(task)
+
+    for _ in xrange(min(FEED_FETCH_THREADS, len(tasks))):
+        thread = threading.Thread(target=_worker)
+        thread.daemon = True
+        thread.start()
+
+    return deadline
+
 def update_trails(server=None, force=False, offline=False):
     """
     Update trails from feeds
@@ -78,7 +146,7 @@ def update_trails(server=None, force=False, offline=False):
     except Exception, ex:
         exit("[!] something went wrong during creation of directory '%s' ('%s')" % (USERS_DIR, ex))
 
-    _chown(USERS_DIR)
+    chown_file(USERS_DIR)
 
     if server:
         logger.info("retrieving trails from provided 'UPDATE_SERVER' server...")
@@ -124,6 +192,8 @@ def update_trails(server=None, force=False, offline=False):
         if config.DISABLED_FEEDS:
             filenames = [filename for filename in filenames if os.path.splitext(os.path.split(filename)[-1])[0] not in re.split(r"[^\w]+", config.DISABLED_FEEDS)]
 
+        tasks = []
+
         for i in xrange(len(filenames)):
             filename = filenames[i]
 
@@ -135,28 +205,41 @@ def update_trails(server=None, force=False, offline=False):
 
             for name, function in inspect.getmembers(module, inspect.isfunction):
                 if name == "fetch":
-                    logger.info("'%s'%s" % (module.__url__, " " * 20 if len(module.__url__) < 20 else ""))
-                    sys.stdout.write("progress: %d/%d (%d%%)\r" % (i, len(filenames), i * 100 / len(filenames)))
-                    sys.stdout.flush()
-
                     if config.DISABLED_TRAILS_INFO_REGEX and re.search(config.DISABLED_TRAILS_INFO_REGEX, getattr(module, "__info__", "")):
                         continue
 
-                    try:
-                        results = function()
-                        for item in results.items():
-                            if item[0].startswith("www.") and '/' not in item[0]:
-                                item = [item[0][len("www."):], item[1]]
-                            if item[0] in trails:
-                                if item[0] not in duplicates:
-                                    duplicates[item[0]] = set((trails[item[0]][1],))
-                                duplicates[item[0]].add(item[1][1])
-                            if not (item[0] in trails and (any(_ in item[1][0] for _ in LOW_PRIORITY_INFO_KEYWORDS) or trails[item[0]][1] in HIGH_PRIORITY_REFERENCES)) or (item[1][1] in HIGH_PRIORITY_REFERENCES and "history" not in item[1][0]) or any(_ in item[1][0] for _ in HIGH_PRIORITY_INFO_KEYWORDS):
-                                trails[item[0]] = item[1]
-                        if not results and "abuse.ch" not in module.__url__:
-                            logger.error("something went wrong during remote data retrieval ('%s')" % module.__url__)
-                    except Exception, ex:
-                        logger.error("something went wrong during processing of feed file '%s' ('%s')" % (filename, ex))
+                    tasks.append(FeedTask(i, filename, module, function))
+
+        deadline = fetch_feeds(tasks)
+
+        # Note: results are merged in order of (sorted) feed files, keeping precedence of trails deterministic
+        for task in tasks:
+            i, filename, module = task.index, task.filename, task.module
+
+            logger.info("'%s'%s" % (module.__url__, " " * 20 if len(module.__url__) < 20 else ""))
+            sys.stdout.write("progress: %d/%d (%d%%)\r" % (i, len(filenames), i * 100 / len(filenames)))
+            sys.stdout.flush()
+
+            if not task.wait(deadline):
+                logger.error("timeout occurred during processing of feed file '%s' (skipping)" % filename)
+            elif task.error is not None:
+                logger.error("something went wrong during processing of feed file '%s' ('%s')" % (filename, task.error))
+            else:
+                try:
+                    results = task.results
+                    for item in results.items():
+                        if item[0].startswith("www.") and '/' not in item[0]:
+                            item = [item[0][len("www."):], item[1]]
+                        if item[0] in trails:
+                            if item[0] not in duplicates:
+                                duplicates[item[0]] = set((trails[item[0]][1],))
+                            duplicates[item[0]].add(item[1][1])
+                        if not (item[0] in trails and (any(_ in item[1][0] for _ in LOW_PRIORITY_INFO_KEYWORDS) or trails[item[0]][1] in HIGH_PRIORITY_REFERENCES)) or (item[1][1] in HIGH_PRIORITY_REFERENCES and "history" not in item[1][0]) or any(_ in item[1][0] for _ in HIGH_PRIORITY_INFO_KEYWORDS):
+                            trails[item[0]] = item[1]
+                    if not results and "abuse.ch" not in module.__url__:
+                        logger.error("something went wrong during remote data retrieval ('%s')" % module.__url__)
+                except Exception, ex:
+                    logger.error("something went wrong during processing of feed file '%s' ('%s')" % (filename, ex))
 
             try:
                 sys.modules.pop(module.__name__)
@@ -290,6 +373,9 @@ def update_trails(server=None, force=False, offline=False):
         if success:
             logger.info("trails stored to '%s'" % TRAILS_FILE)
 
+            # Note: (memory mapped) snapshot pages are shared between all processes
+            trails = store_trails_snapshot(trails)
+
     return trails
 
 def update_ipcat(force=False):
@@ -299,7 +385,7 @@ def update_ipcat(force=False):
     except Exception, ex:
         exit("[!] something went wrong during creation of directory '%s' ('%s')" % (USERS_DIR, ex))
 
-    _chown(USERS_DIR)
+    chown_file(USERS_DIR)
 
     if force or not os.path.isfile(IPCAT_CSV_FILE) or not os.path.isfile(IPCAT_SQLITE_FILE) or (time.time() - os.stat(IPCAT_CSV_FILE).st_mtime) >= FRESH_IPCAT_DELTA_DAYS * 24 * 3600 or os.stat(IPCAT_SQLITE_FILE).st_size == 0:
         logger.info("updating ipcat database...")
@@ -332,8 +418,8 @@ def update_ipcat(force=False):
             except Exception, ex:
                 logger.error("something went wrong during ipcat database update ('%s')" % ex)
 
-    _chown(IPCAT_CSV_FILE)
-    _chown(IPCAT_SQLITE_FILE)
+    chown_file(IPCAT_CSV_FILE)
+    chown_file(IPCAT_SQLITE_FILE)
 
 def main():
     try:
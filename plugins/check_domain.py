@@ -11,6 +11,13 @@ from core.enums import TRAIL
 from core.events.Event import Event
 from core.events.Event import SEVERITY
 
+__filter__ = "tcp and (ip[2:2] - ((ip[0] & 0xf) << 2) - ((tcp[12] & 0xf0) >> 2)) != 0"  # TCP with payload
+__protocols__ = (socket.IPPROTO_TCP,)
+__tcp_flags__ = lambda flags: flags != 0x02  # anything but SYN (only)
+__priority__ = 30
+__max_severity__ = SEVERITY.MEDIUM
+__max_accuracy__ = 100
+
 def _check_domain(query, packet, config, trails):
     if query:
         query = query.lower()
@@ -26,17 +33,15 @@ def _check_domain(query, packet, config, trails):
     if not check_domain_whitelisted(query) and all(_ in VALID_DNS_CHARS for _ in query):
         parts = query.lower().split('.')
 
-        for i in xrange(0, len(parts)):
-            domain = '.'.join(parts[i:])
-            if domain in trails:
-                if domain == query:
-                    trail = domain
-                else:
-                    _ = ".%s" % domain
-                    trail = "(%s)%s" % (query[:-len(_)], _)
+        for domain, found in trails.find_domains(query):
+            if domain == query:
+                trail = domain
+            else:
+                _ = ".%s" % domain
+                trail = "(%s)%s" % (query[:-len(_)], _)
 
-                if not (re.search(r"(?i)\Ad?ns\d*\.", query) and any(_ in trails.get(domain, " ")[0] for _ in ("suspicious", "sinkhole"))):  # e.g. ns2.nobel.su
-                    return Event(packet, TRAIL.DNS, trail, trails[domain][0], trails[domain][1], accuracy=100, severity=SEVERITY.MEDIUM)
+            if not (re.search(r"(?i)\Ad?ns\d*\.", query) and any(_ in found[0] for _ in ("suspicious", "sinkhole"))):  # e.g. ns2.nobel.su
+                return Event(packet, TRAIL.DNS, trail, found[0], found[1], accuracy=100, severity=SEVERITY.MEDIUM)
 
         if config.USE_HEURISTICS:
             if len(parts[0]) > SUSPICIOUS_DOMAIN_LENGTH_THRESHOLD and '-' not in parts[0]:
@@ -55,38 +60,30 @@ def _check_domain(query, packet, config, trails):
     result_cache[query] = False
 
 def plugin(packet, config, trails):
-    if packet.ip.get_ip_p() == socket.IPPROTO_TCP:
-        tcp_header = packet.ip.child()
-        flags = tcp_header.get_th_flags()
+    if packet.protocol == socket.IPPROTO_TCP:
+        flags = packet.tcp[5]
 
         if flags != 2:
-            tcp_data = tcp_header.get_data_as_string()
-            method, path = None, None
-            dst_ip = packet.ip.get_ip_dst()
-            dst_port = tcp_header.get_th_dport()
-
-            index = tcp_data.find("\r\n")
-            if index >= 0:
-                line = tcp_data[:index]
-                if line.count(' ') == 2 and " HTTP/" in line:
-                    method, path, _ = line.split(' ')
-            
+            http = packet.http
+
+            if http is None:
+                return
+
+            method, path = http.method, http.path
+            dst_ip = packet.dst_ip
+            dst_port = packet.dst_port
+
             if method and path:
                 host = dst_ip
-                first_index = tcp_data.find("\r\nHost:")
                 path = path.lower()
 
-                if first_index >= 0:
-                    first_index = first_index + len("\r\nHost:")
-                    last_index = tcp_data.find("\r\n", first_index)
-                    if last_index >= 0:
-                        host = tcp_data[first_index:last_index]
-                        host = host.strip().lower()
-                        if host.endswith(":80"):
-                            host = host[:-3]
-                        
-                        if not (host and host[0].isalpha() and dst_ip in trails):
-                            _check_domain(host, packet, config, trails)
+                if "host" in http.headers:
+                    host = http.headers["host"].lower()
+                    if host.endswith(":80"):
+                        host = host[:-3]
+
+                    if not (host and host[0].isalpha() and trails.get_ip(packet.dst_ip_int, packet.ip_version)):
+                        _check_domain(host, packet, config, trails)
 
                 if config.USE_HEURISTICS and dst_port == 80 and path.startswith("http://") and not check_domain_whitelisted(urlparse.urlparse(path).netloc.split(':')[0]):
                     trail = re.sub(r"(http://[^/]+/)(.+)", r"\g<1>(\g<2>)", path)
@@ -1,5 +1,6 @@
 import os
 import re
+import socket
 import urllib
 import urlparse
 
@@ -19,67 +20,63 @@ from core.settings import WHITELIST_DIRECT_DOWNLOAD_KEYWORDS
 from core.settings import WHITELIST_HTTP_REQUEST_PATHS
 from core.settings import WHITELIST_UA_KEYWORDS
 
+__filter__ = "tcp and (ip[2:2] - ((ip[0] & 0xf) << 2) - ((tcp[12] & 0xf0) >> 2)) != 0"  # TCP with payload
+__protocols__ = (socket.IPPROTO_TCP,)
+__tcp_flags__ = lambda flags: flags != 0x02  # anything but SYN (only)
+__priority__ = 10
+__max_severity__ = SEVERITY.VERY_LOW
+__max_accuracy__ = 50
+
 
 def plugin(packet, config, trails):
     if hasattr(packet, 'tcp'):
         src_port, dst_port, _, _, doff_reserved, flags = packet.tcp
 
         if flags != 2:
-            tcph_length = doff_reserved >> 4
-            h_size = packet.iph_length + (tcph_length << 2)
-            tcp_data = packet.ip_data[h_size:]
+            http = packet.http
+
+            if http is None:
+                return
+
+            # Note: TCP payload is accessed in place (offsets into frame), without copying it
+            frame, end = packet.frame, packet.ip_end
 
-            if tcp_data.startswith("HTTP/"):
-                if any(_ in tcp_data[:tcp_data.find("\r\n\r\n")] for _ in ("X-Sinkhole:", "X-Malware-Sinkhole:", "Server: You got served", "Server: Apache 1.0/SinkSoft", "sinkdns.org")) or "\r\n\r\nsinkhole" in tcp_data:
+            if http.response:
+                if any(_ in http.head for _ in ("X-Sinkhole:", "X-Malware-Sinkhole:", "Server: You got served", "Server: Apache 1.0/SinkSoft", "sinkdns.org")) or http.body_offset is not None and frame.startswith("sinkhole", http.body_offset, end):
                     return Event(packet, TRAIL.IP, packet.src_ip, "sinkhole response (malware)", "(heuristic)", accuracy=50, severity=SEVERITY.VERY_LOW)
                 else:
-                    index = tcp_data.find("<title>")
+                    index = frame.find("<title>", http.body_offset or packet.payload_offset, end)
                     if index >= 0:
-                        title = tcp_data[index + len("<title>"):tcp_data.find("</title>", index)]
+                        close = frame.find("</title>", index, end)
+                        title = frame[index + len("<title>"):close if close >= 0 else end - 1]
                         if all(_ in title.lower() for _ in ("this domain", "has been seized")):
                             return Event(packet, TRAIL.IP, title, "seized domain (suspicious)", "(heuristic)")
 
-                content_type = None
-                first_index = tcp_data.find("\r\nContent-Type:")
-                if first_index >= 0:
-                    first_index = first_index + len("\r\nContent-Type:")
-                    last_index = tcp_data.find("\r\n", first_index)
-                    if last_index >= 0:
-                        content_type = tcp_data[first_index:last_index].strip().lower()
+                content_type = http.headers.get("content-type", "").lower()
 
                 if content_type and content_type in SUSPICIOUS_CONTENT_TYPES:
                     return Event(packet, TRAIL.HTTP, content_type, "content type (suspicious)", "(heuristic)")
 
-            method, path = None, None
-            index = tcp_data.find("\r\n")
-            if index >= 0:
-                line = tcp_data[:index]
-                if line.count(' ') == 2 and " HTTP/" in line:
-                    method, path, _ = line.split(' ')
+            method, path = http.method, http.path
 
             if method and path:
                 post_data = None
                 host = packet.dst_ip
-                first_index = tcp_data.find("\r\nHost:")
                 path = path.lower()
 
-                if first_index >= 0:
-                    first_index = first_index + len("\r\nHost:")
-                    last_index = tcp_data.find("\r\n", first_index)
-                    if last_index >= 0:
-                        host = tcp_data[first_index:last_index]
-                        host = host.strip().lower()
-                        if host.endswith(":80"):
-                            host = host[:-3]
-                        if host and host[0].isalpha() and packet.dst_ip in trails:
-                            return Event(packet, TRAIL.IP, "%s (%s)" % (packet.dst_ip, host.split(':')[0]),
-                                         trails[packet.dst_ip][0], trails[packet.dst_ip][1])
+                if "host" in http.headers:
+                    host = http.headers["host"].lower()
+                    if host.endswith(":80"):
+                        host = host[:-3]
+                    if host and host[0].isalpha():
+                        found = trails.get_ip(packet.dst_ip_int, packet.ip_version)
+                        if found:
+                            return Event(packet, TRAIL.IP, "%s (%s)" % (packet.dst_ip, host.split(':')[0]), found[0], found[1])
                 elif config.USE_HEURISTICS and config.CHECK_MISSING_HOST:
                     return Event(packet, TRAIL.HTTP, "%s%s" % (host, path), "missing host header (suspicious)", "(heuristic)")
 
-                index = tcp_data.find("\r\n\r\n")
-                if index >= 0:
-                    post_data = tcp_data[index + 4:]
+                if http.body_offset is not None:
+                    post_data = frame[http.body_offset:end]
 
                 if "://" in path:
                     url = path.split("://", 1)[1]
@@ -109,13 +106,8 @@ def plugin(packet, config, trails):
                 if config.USE_HEURISTICS:
                     user_agent, result = None, None
 
-                    first_index = tcp_data.find("\r\nUser-Agent:")
-                    if first_index >= 0:
-                        first_index = first_index + len("\r\nUser-Agent:")
-                        last_index = tcp_data.find("\r\n", first_index)
-                        if last_index >= 0:
-                            user_agent = tcp_data[first_index:last_index]
-                            user_agent = urllib.unquote(user_agent).strip()
+                    if http.headers.get("user-agent"):
+                        user_agent = urllib.unquote(http.headers["user-agent"]).strip()
 
                     if user_agent:
                         result = result_cache.get(user_agent)
@@ -155,16 +147,18 @@ def plugin(packet, config, trails):
 
                 for check in filter(None, checks):
                     for _ in ("", host):
-                        check = "%s%s" % (_, check)
-                        if check in trails:
+                        found = trails.get_url(_, check)
+                        if found:
+                            check = "%s%s" % (_, check)
                             parts = url.split(check)
                             other = ("(%s)" % _ if _ else _ for _ in parts)
                             trail = check.join(other)
-                            return Event(packet, TRAIL.URL, trail, trails[check][0], trails[check][1])
+                            return Event(packet, TRAIL.URL, trail, found[0], found[1])
 
-                if "%s/" % host in trails:
+                found = trails.get_url(host, '/')
+                if found:
                     trail = "%s/" % host
-                    return Event(packet, TRAIL.URL, trail, trails[trail][0], trails[trail][1])
+                    return Event(packet, TRAIL.URL, trail, found[0], found[1])
 
                 if config.USE_HEURISTICS:
                     unquoted_path = urllib.unquote(path)
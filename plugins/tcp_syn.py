@@ -1,5 +1,16 @@
+import socket
+
 from core.enums import TRAIL
 from core.events.Event import Event
+from core.events.Event import SEVERITY
+from core.trails.trailsdict import addr_value
+
+__filter__ = "tcp[tcpflags] == tcp-syn"
+__protocols__ = (socket.IPPROTO_TCP,)
+__tcp_flags__ = (0xff, 0x02)  # SYN (only)
+__priority__ = 0
+__max_severity__ = SEVERITY.VERY_LOW
+__max_accuracy__ = 0
 
 _last_syn = None
 _last_logged_syn = None
@@ -17,30 +28,43 @@ def plugin(packet, config, trails):
 
         if flags == 2:  # SYN set (only)
             _ = _last_syn
-            _last_syn = (packet.sec, packet.src_ip, src_port, packet.dst_ip, dst_port)
+            _last_syn = (packet.sec, packet.src_ip_int, src_port, packet.dst_ip_int, dst_port)
 
             if _ == _last_syn:  # skip bursts
                 return
 
             if config.USE_HEURISTICS:
-                if packet.dst_ip != packet.localhost_ip:
-                    key = "%s~%s" % (packet.src_ip, packet.dst_ip)
+                if packet.dst_ip_int != packet.localhost_ip_int:
+                    key = (packet.src_ip_int, packet.dst_ip_int)
                     if key not in _connect_src_dst:
                         _connect_src_dst[key] = set()
                         _connect_src_details[key] = set()
                     _connect_src_dst[key].add(dst_port)
                     _connect_src_details[key].add((packet.sec, packet.usec, src_port, dst_port))
 
-            if packet.dst_ip in trails or "%s:%s" % (packet.dst_ip, dst_port) in trails:
-                _ = _last_logged_syn
-                _last_logged_syn = _last_syn
-                if _ != _last_logged_syn:
-                    trail = packet.dst_ip if packet.dst_ip in trails else "%s:%s" % (packet.dst_ip, dst_port)
-                    return Event(packet, TRAIL.IP if ':' not in trail else TRAIL.ADDR, trail, trails[trail][0], trails[trail][1])
+            found = trails.get_ip(packet.dst_ip_int, packet.ip_version)
+            addr = None if found else trails.get_addr(packet.dst_ip_int, dst_port, packet.ip_version)
 
-            elif (packet.src_ip in trails or "%s:%s" % (packet.src_ip, src_port) in trails) and packet.dst_ip != packet.localhost_ip:
+            if found or addr:
                 _ = _last_logged_syn
                 _last_logged_syn = _last_syn
                 if _ != _last_logged_syn:
-                    trail = packet.src_ip if packet.src_ip in trails else "%s:%s" % (packet.src_ip, src_port)
-                    return Event(packet, TRAIL.IP if ':' not in trail else TRAIL.ADDR, trail, trails[trail][0], trails[trail][1])
+                    if found:
+                        return Event(packet, TRAIL.IP, packet.dst_ip, found[0], found[1])
+                    else:
+                        trail = addr_value(packet.ip_version, (packet.dst_ip_int, dst_port))
+                        return Event(packet, TRAIL.ADDR, trail, addr[0], addr[1])
+
+            elif packet.dst_ip_int != packet.localhost_ip_int:
+                found = trails.get_ip(packet.src_ip_int, packet.ip_version)
+                addr = None if found else trails.get_addr(packet.src_ip_int, src_port, packet.ip_version)
+
+                if found or addr:
+                    _ = _last_logged_syn
+                    _last_logged_syn = _last_syn
+                    if _ != _last_logged_syn:
+                        if found:
+                            return Event(packet, TRAIL.IP, packet.src_ip, found[0], found[1])
+                        else:
+                            trail = addr_value(packet.ip_version, (packet.src_ip_int, src_port))
+                            return Event(packet, TRAIL.ADDR, trail, addr[0], addr[1])
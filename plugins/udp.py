@@ -14,9 +14,15 @@ from core.settings import SUSPICIOUS_DOMAIN_CONSONANT_THRESHOLD
 from core.settings import IGNORE_DNS_QUERY_SUFFIXES
 from core.settings import CONSONANTS
 from core.trails.check_domain import check_domain_whitelisted
-from core.trails.check_domain import check_domain_member
 from core.enums import TRAIL
 from core.events.Event import Event
+from core.events.Event import SEVERITY
+
+__filter__ = "udp"
+__protocols__ = (socket.IPPROTO_UDP,)
+__priority__ = 0
+__max_severity__ = SEVERITY.VERY_LOW
+__max_accuracy__ = 0
 
 _last_udp = None
 _last_logged_udp = None
@@ -35,48 +41,48 @@ def plugin(packet, config, trails):
 
     if hasattr(packet, 'udp'):  # UDP
 
-        _ = packet.ip_data[packet.iph_length:packet.iph_length + 4]
-        if len(_) < 4:
+        if len(packet.frame) < packet.l4_offset + 4:
             # Skip packets without data
             return
 
         src_port, dst_port = packet.udp
 
         _ = _last_udp
-        _last_udp = (packet.sec, packet.src_ip, src_port, packet.dst_ip, dst_port)
+        _last_udp = (packet.sec, packet.src_ip_int, src_port, packet.dst_ip_int, dst_port)
         if _ == _last_udp:  # skip bursts
             return
 
         if src_port != 53 and dst_port != 53:  # not DNS
-            if packet.dst_ip in trails:
+            found = trails.get_ip(packet.dst_ip_int, packet.ip_version)
+            if found:
                 trail = packet.dst_ip
-            elif packet.src_ip in trails:
-                trail = packet.src_ip
             else:
-                trail = None
+                found = trails.get_ip(packet.src_ip_int, packet.ip_version)
+                trail = packet.src_ip if found else None
 
             if trail:
                 _ = _last_logged_udp
                 _last_logged_udp = _last_udp
                 if _ != _last_logged_udp:
-                    return Event(packet, TRAIL.IP, trail, trails[trail][0], trails[trail][1])
+                    return Event(packet, TRAIL.IP, trail, found[0], found[1])
 
         else:
-            dns_data = packet.ip_data[packet.iph_length + 8:]
+            # Note: DNS message is parsed in place (offsets into frame), without copying it
+            frame, start, end = packet.frame, packet.payload_offset, packet.ip_end
 
             # Reference: http://www.ccs.neu.edu/home/amislove/teaching/cs4700/fall09/handouts/project1-primer.pdf
-            if len(dns_data) > 6:
-                qdcount = struct.unpack("!H", dns_data[4:6])[0]
+            if end - start > 6:
+                qdcount = struct.unpack_from("!H", frame, start + 4)[0]
                 if qdcount > 0:
-                    offset = 12
+                    offset = start + 12
                     query = ""
 
-                    while len(dns_data) > offset:
-                        length = ord(dns_data[offset])
+                    while end > offset:
+                        length = ord(frame[offset])
                         if not length:
                             query = query[:-1]
                             break
-                        query += dns_data[offset + 1:offset + length + 1] + '.'
+                        query += frame[offset + 1:min(offset + length + 1, end)] + '.'
                         offset += length + 1
 
                     query = query.lower()
@@ -87,9 +93,9 @@ def plugin(packet, config, trails):
                     parts = query.split('.')
 
                     # standard query (both recursive and non-recursive)
-                    if ord(dns_data[2]) & 0xfe == 0x00:
+                    if ord(frame[start + 2]) & 0xfe == 0x00:
                         type_, class_ = struct.unpack(
-                            "!HH", dns_data[offset + 1:offset + 5])
+                            "!HH", frame[offset + 1:min(offset + 5, end)])
 
                         if len(parts) > 2:
                             if len(parts) > 3 and len(parts[-2]) <= 3:
@@ -125,36 +131,38 @@ def plugin(packet, config, trails):
                         # Reference: http://en.wikipedia.org/wiki/List_of_DNS_record_types
                         # Type not in (PTR, AAAA), Class IN
                         if type_ not in (12, 28) and class_ == 1:
-                            if packet.dst_ip in trails:
-                                return Event(packet, TRAIL.IP, "%s (%s)" % (packet.dst_ip, query), trails[packet.dst_ip][0], trails[packet.dst_ip][1])
-                            elif packet.src_ip in trails:
-                                return Event(packet, TRAIL.IP, packet.src_ip, trails[packet.src_ip][0], trails[packet.src_ip][1])
+                            found = trails.get_ip(packet.dst_ip_int, packet.ip_version)
+                            if found:
+                                return Event(packet, TRAIL.IP, "%s (%s)" % (packet.dst_ip, query), found[0], found[1])
+
+                            found = trails.get_ip(packet.src_ip_int, packet.ip_version)
+                            if found:
+                                return Event(packet, TRAIL.IP, packet.src_ip, found[0], found[1])
 
                             # TODO: Move to check_domain?
                             # _check_domain(query, sec, usec, src_ip, src_port, dst_ip, dst_port, PROTO.UDP, packet)
 
                     elif config.USE_HEURISTICS:
-                        if ord(dns_data[2]) & 0x80:  # standard response
+                        if ord(frame[start + 2]) & 0x80:  # standard response
                             # recursion available, no error
-                            if ord(dns_data[3]) == 0x80:
+                            if ord(frame[start + 3]) == 0x80:
                                 _ = offset + 5
                                 try:
-                                    while _ < len(dns_data):
+                                    while _ < end:
                                         # Type A
-                                        if ord(dns_data[_]) & 0xc0 != 0 and dns_data[_ + 2] == "\00" and dns_data[_ + 3] == "\x01":
+                                        if _ + 3 < end and ord(frame[_]) & 0xc0 != 0 and frame[_ + 2] == "\00" and frame[_ + 3] == "\x01":
                                             break
                                         else:
                                             # TODO: This should not be in a try catch, this is a bug somewhere, fix it or use impacket for this
                                             try:
-                                                _ += 12 + struct.unpack("!H", dns_data[_ + 10: _ + 12])[0]
+                                                _ += 12 + struct.unpack("!H", frame[_ + 10:min(_ + 12, end)])[0]
                                             except Exception:
                                                 return
                                     
-                                    _ = dns_data[_ + 12:_ + 16]
-                                    if _:
-                                        answer = socket.inet_ntoa(_)
-                                        if answer in trails:
-                                            _ = trails[answer]
+                                    _ = frame[_ + 12:min(_ + 16, end)]
+                                    if len(_) == 4:
+                                        _ = trails.get_ip(struct.unpack("!I", _)[0])
+                                        if _:
                                             if "sinkhole" in _[0]:
                                                 trail = "(%s).%s" % ('.'.join(parts[:-1]), '.'.join(parts[-1:]))
                                                 return Event(packet, TRAIL.DNS, trail, "sinkholed by %s (malware)" % _[0].split(" ")[1], "(heuristic)") # (e.g. kitro.pl, devomchart.com, jebena.ananikolic.su, vuvet.cn)
@@ -166,8 +174,8 @@ def plugin(packet, config, trails):
                                     pass
 
                             # recursion available, no such name
-                            elif ord(dns_data[3]) == 0x83:
-                                if '.'.join(parts[-2:]) not in _dns_exhausted_domains and not check_domain_whitelisted(query) and not check_domain_member(query, trails):
+                            elif ord(frame[start + 3]) == 0x83:
+                                if '.'.join(parts[-2:]) not in _dns_exhausted_domains and not check_domain_whitelisted(query) and not any(trails.find_domains(query)):
                                     if parts[-1].isdigit():
                                         return
 
@@ -30,9 +30,14 @@ from core.attribdict import AttribDict
 from core.common import check_connection
 from core.common import check_sudo
 from core.common import load_trails
+from core.common import publish_trails
 from core.enums import BLOCK_MARKER
+from core.enums import OVERFLOW_POLICY
 from core.utils.memory import check_memory
+from core.utils.memory import get_total_physmem
 from core.settings import config
+from core.settings import AF_PACKET_RING_SIZE
+from core.settings import BLOCK_LENGTH
 from core.settings import CAPTURE_TIMEOUT
 from core.settings import CHECK_CONNECTION_MAX_RETRIES
 from core.settings import CONFIG_FILE
@@ -49,14 +54,24 @@ from core.settings import DEFAULT_PLUGINS
 from core.trails.update import update_ipcat
 from core.trails.update import update_trails
 from core.plugins.load_plugins import load_plugins
+from core.plugins.load_plugins import build_capture_filter
+from core.plugins.load_plugins import build_dispatch_table
 from core.plugins.load_triggers import load_triggers
-from core.Threads.parallel import init_threads, stop_threads
-from core.Threads.ReaderAndDecoderThread import ReaderAndDecoderThread, reader_end_of_file
+from core.profiler import PLUGIN
+from core.profiler import TRIGGER
+from core.profiler import profiled
+from core.Threads.parallel import init_threads, init_reader_threads, stop_threads
+from core.Threads.ReaderAndDecoderThread import reader_end_of_file
+from core.Threads.offline import analyze_files
+from core.Threads.watch import watch_directory
 from core.utils.Figlet import figlet
+from core.net.afpacket import AFPacketCapture
+from core.net.afpacket import FANOUT_MODES
 from core.Threads.StatusThread import print_status
 from core.utils.file_handler import create_log_directory
 
 _caps = []
+_interfaces = []
 
 try:
     import pcapy
@@ -68,6 +83,27 @@ except ImportError:
             break
     exit(msg)
 
+def _parse_size(name):
+    """
+    Parses size configuration value (e.g. 1048576, 512MB or 10%) into bytes
+    """
+
+    value = config[name]
+
+    if str(value).isdigit():
+        return int(value)
+    elif re.search(r"\A\d+\s*[kKmMgG]B\Z", value):
+        match = re.search(r"(\d+)\s*([kKmMgG])B", value)
+        return int(match.group(1)) * {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}[match.group(2).upper()]
+    elif re.search(r"\A\d+%\Z", value):
+        physmem = get_total_physmem()
+        if physmem:
+            return physmem * int(re.search(r"(\d+)%", value).group(1)) / 100
+        else:
+            exit("[!] unable to determine total physical memory. Please use absolute value for '%s'" % name)
+    else:
+        exit("[!] invalid format for configuration value '%s' ('%s')" % (name, value))
+
 def init():
     """
     Performs sensor initialization
@@ -94,10 +130,9 @@ def init():
             update_ipcat()
 
         if _:
-            trails.clear()
-            trails.update(_)
+            publish_trails(_)
         elif not trails:
-            trails.update(load_trails())
+            publish_trails(load_trails())
 
         thread = threading.Timer(config.UPDATE_PERIOD, update_timer)
         thread.start()
@@ -122,12 +157,41 @@ def init():
     logger.info("Loading plugins:" + str(config.plugins))
     config.plugin_functions = load_plugins(config.plugins)
 
+    if config.USE_PROFILER:
+        config.plugin_functions = profiled(PLUGIN, config.plugin_functions)
+
+    config.plugin_dispatch = build_dispatch_table(config.plugin_functions)
+
     if config.triggers:
         logger.info("Loading triggers:" + str(config.triggers))
         config.trigger_functions = load_triggers(config.triggers)
 
-    if config.pcap_file:
+        if config.USE_PROFILER:
+            config.trigger_functions = profiled(TRIGGER, config.trigger_functions)
+
+    if config.CAPTURE_BACKEND not in (None, "pcap", "afpacket"):
+        exit("[!] invalid configuration value for 'CAPTURE_BACKEND' ('%s')" % config.CAPTURE_BACKEND)
+
+    if config.PROCESS_COUNT:
+        if not str(config.PROCESS_COUNT).isdigit() or int(config.PROCESS_COUNT) < 1:
+            exit("[!] invalid configuration value for 'PROCESS_COUNT' ('%s')" % config.PROCESS_COUNT)
+        config.PROCESS_COUNT = int(config.PROCESS_COUNT)
+
+    config.AF_PACKET_RING_SIZE = _parse_size("AF_PACKET_RING_SIZE") if config.AF_PACKET_RING_SIZE else AF_PACKET_RING_SIZE
+
+    if config.AF_PACKET_FANOUT:
+        if config.AF_PACKET_FANOUT not in FANOUT_MODES:
+            exit("[!] invalid configuration value for 'AF_PACKET_FANOUT' ('%s')" % config.AF_PACKET_FANOUT)
+        elif config.CAPTURE_BACKEND != "afpacket" or config.pcap_file:
+            exit("[!] configuration option 'AF_PACKET_FANOUT' requires live capture with 'CAPTURE_BACKEND afpacket'")
+        elif any(_.strip().lower() == "any" for _ in (config.MONITOR_INTERFACE or "").split(',')):
+            exit("[!] configuration option 'AF_PACKET_FANOUT' doesn't support virtual interface 'any' (please list monitoring interfaces explicitly)")
+
+    if config.offline or config.WATCH_DIR:
+        pass  # Note: capture files are opened (and split) by the offline analyzer (or directory watcher) itself
+    elif config.pcap_file:
         _caps.append(pcapy.open_offline(config.pcap_file))
+        _interfaces.append(config.pcap_file)
     else:
         interfaces = set(_.strip() for _ in config.MONITOR_INTERFACE.split(','))
 
@@ -145,7 +209,22 @@ def init():
 
             logger.info("opening interface '%s'" % interface)
             try:
-                _caps.append(pcapy.open_live(interface, SNAP_LEN, True, CAPTURE_TIMEOUT))
+                if config.AF_PACKET_FANOUT:
+                    group = (os.getpid() + len(_caps)) & 0xffff
+                    for i in xrange(config.PROCESS_COUNT or 1):
+                        _ = AFPacketCapture(interface, SNAP_LEN, True, CAPTURE_TIMEOUT, config.AF_PACKET_RING_SIZE)
+                        _.join_fanout(group, config.AF_PACKET_FANOUT)
+                        _caps.append(_)
+                        _interfaces.append("%s#%d" % (interface, i))
+                elif config.CAPTURE_BACKEND == "afpacket" and interface.lower() != "any":
+                    _caps.append(AFPacketCapture(interface, SNAP_LEN, True, CAPTURE_TIMEOUT, config.AF_PACKET_RING_SIZE))
+                    _interfaces.append(interface)
+                else:
+                    if config.CAPTURE_BACKEND == "afpacket":
+                        logger.warning("virtual interface 'any' is captured with pcapy (AF_PACKET capture supports only interfaces with Ethernet link type)")
+
+                    _caps.append(pcapy.open_live(interface, SNAP_LEN, True, CAPTURE_TIMEOUT))
+                    _interfaces.append(interface)
             except (socket.error, pcapy.PcapError):
                 if "permitted" in str(sys.exc_info()[1]):
                     exit("[!] please run '%s' with sudo/Administrator privileges" % __file__)
@@ -160,13 +239,40 @@ def init():
     if config.SYSLOG_SERVER and not len(config.SYSLOG_SERVER.split(':')) == 2:
         exit("[!] invalid configuration value for 'SYSLOG_SERVER' ('%s')" % config.SYSLOG_SERVER)
 
+    if config.QUEUE_OVERFLOW_POLICY and config.QUEUE_OVERFLOW_POLICY not in (OVERFLOW_POLICY.BLOCK, OVERFLOW_POLICY.DROP_NEWEST, OVERFLOW_POLICY.DROP_OLDEST, OVERFLOW_POLICY.SAMPLE):
+        exit("[!] invalid configuration value for 'QUEUE_OVERFLOW_POLICY' ('%s')" % config.QUEUE_OVERFLOW_POLICY)
+
+    if config.QUEUE_OVERFLOW_SAMPLE_RATE and not isinstance(config.QUEUE_OVERFLOW_SAMPLE_RATE, int):
+        exit("[!] invalid configuration value for 'QUEUE_OVERFLOW_SAMPLE_RATE' ('%s')" % config.QUEUE_OVERFLOW_SAMPLE_RATE)
+
+    if config.CAPTURE_BUFFER:
+        config.CAPTURE_BUFFER = _parse_size("CAPTURE_BUFFER") / BLOCK_LENGTH * BLOCK_LENGTH
+
+    if config.USE_PLUGIN_CAPTURE_FILTER:
+        _ = build_capture_filter(config.plugin_functions)
+        if _:
+            config.CAPTURE_FILTER = "(%s) and (%s)" % (config.CAPTURE_FILTER, _) if config.CAPTURE_FILTER else _
+
+    if config.offline or config.WATCH_DIR:
+        # Note: capture filter is applied to packets read from capture files by the offline analyzer (or directory watcher) itself
+        if config.CAPTURE_FILTER:
+            try:
+                pcapy.compile(pcapy.DLT_EN10MB, SNAP_LEN, config.CAPTURE_FILTER, True, 0)
+            except pcapy.PcapError, ex:
+                logger.error("unable to set capture filter ('%s')" % ex)
+                config.CAPTURE_FILTER = None
+            else:
+                logger.info("setting capture filter '%s'" % config.CAPTURE_FILTER)
+
+        return
+
     if config.CAPTURE_FILTER:
         logger.info("setting capture filter '%s'" % config.CAPTURE_FILTER)
         for _cap in _caps:
             try:
                 _cap.setfilter(config.CAPTURE_FILTER)
             except:
-                pass
+                logger.error("unable to set capture filter ('%s')" % sys.exc_info()[1])
     
     logger.info("Starting processing threads...")
 
@@ -181,13 +287,21 @@ def monitor():
 
     logger.info("running...")
 
-    print_status()
+    if config.offline:
+        analyze_files(config.pcap_files)
+        return
+
+    if config.WATCH_DIR:
+        try:
+            watch_directory(config.WATCH_DIR)
+        except KeyboardInterrupt:
+            logger.warning("stopping (Ctrl-C pressed)")
+        return
+
+    print_status(zip(_interfaces, _caps))
     
     try:
-        for _cap in _caps:
-            reader_and_decoder_thread = ReaderAndDecoderThread(_cap)
-            reader_and_decoder_thread.daemon = True
-            reader_and_decoder_thread.start()
+        init_reader_threads(_caps)
 
         while _caps and not reader_end_of_file.is_set():
             time.sleep(1)
@@ -220,6 +334,8 @@ def main():
     parser = optparse.OptionParser(version=VERSION)
     parser.add_option("-c", dest="config_file", default=CONFIG_FILE, help="configuration file (default: '%s')" % os.path.split(CONFIG_FILE)[-1])
     parser.add_option("-i", dest="pcap_file", help="open pcap file for offline analysis")
+    parser.add_option("--offline", dest="offline", action="store_true", help="analyze pcap file(s) in parallel (e.g. -i \"1.pcap,2.pcapng\" --offline)")
+    parser.add_option("-w", dest="watch_dir", help="watch directory for (rotated) pcap files")
     parser.add_option("--console", dest="console", action="store_true", help="print events to console (too)")
     parser.add_option("--no-updates", dest="no_updates", action="store_true", help="disable (online) trail updates")
     parser.add_option("--debug", dest="debug", action="store_true", help=optparse.SUPPRESS_HELP)
@@ -252,7 +368,28 @@ def main():
         if isinstance(getattr(options, option), (basestring, bool)) and not option.startswith('_'):
             config[option] = getattr(options, option)
 
-    if options.pcap_file:
+    if options.watch_dir:
+        config.WATCH_DIR = options.watch_dir
+
+    if config.WATCH_DIR:
+        if options.pcap_file:
+            exit("[!] option '-i' can't be used together with directory watch")
+        elif not os.path.isdir(config.WATCH_DIR):
+            exit("[!] missing watch directory '%s'" % config.WATCH_DIR)
+        else:
+            logger.info("using watch directory '%s'" % config.WATCH_DIR)
+
+    if options.offline:
+        if not options.pcap_file or options.pcap_file == '-':
+            exit("[!] option '--offline' requires pcap file(s) (option '-i')")
+
+        config.pcap_files = [_.strip() for _ in options.pcap_file.split(',') if _.strip()]
+        for pcap_file in config.pcap_files:
+            if not os.path.isfile(pcap_file):
+                exit("missing pcap file '%s'" % pcap_file)
+
+        logger.info("using pcap file(s) '%s' (offline analysis)" % "', '".join(config.pcap_files))
+    elif options.pcap_file:
         if options.pcap_file == '-':
             logger.info("using STDIN")
         elif not os.path.isfile(options.pcap_file):
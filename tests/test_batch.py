@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) 2018-present Jasper De Moor (@DeMoorJasper)
+See the file 'LICENSE' for copying permission
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core.net.batch import batch_length
+from core.net.batch import pack_batch
+from core.net.batch import unpack_batch
+
+class TestBatch(unittest.TestCase):
+    def test_roundtrip(self):
+        frames = [(1, 2, "abc"), (3, 4, ""), (5, 6, "x" * 1500)]
+        chunk = pack_batch(1, frames)
+
+        self.assertEqual(batch_length(chunk), 3)
+        self.assertEqual(unpack_batch(chunk), [(1,) + _ for _ in frames])
+
+    def test_large_frame(self):
+        frames = [(1, 2, "x" * 70000), (3, 4, "y" * 65536), (5, 6, "z")]
+        chunk = pack_batch(1, frames)
+
+        self.assertEqual(unpack_batch(chunk), [(1,) + _ for _ in frames])
+
+if __name__ == "__main__":
+    unittest.main()
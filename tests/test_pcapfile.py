@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) 2018-present Jasper De Moor (@DeMoorJasper)
+See the file 'LICENSE' for copying permission
+"""
+
+import os
+import signal
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core.net.pcapfile import CaptureFile
+
+def _block(block_type, body, length=None):
+    body += '\x00' * (-len(body) % 4)
+    length = 12 + len(body) if length is None else length
+    return struct.pack("<II", block_type, length) + body + struct.pack("<I", length)
+
+SECTION_HEADER = _block(0x0a0d0d0a, struct.pack("<IHHq", 0x1a2b3c4d, 1, 0, -1))
+INTERFACE = _block(1, struct.pack("<HHI", 1, 0, 65535))
+
+def _packet(frame, timestamp=1000000):
+    return _block(6, struct.pack("<IIIII", 0, timestamp >> 32, timestamp & 0xffffffff, len(frame), len(frame)) + frame)
+
+class TestPcapng(unittest.TestCase):
+    def setUp(self):
+        # Note: regression of an endless loop should fail (instead of hanging the test run)
+        signal.signal(signal.SIGALRM, lambda *_: self.fail("timeout"))
+        signal.alarm(5)
+
+    def tearDown(self):
+        signal.alarm(0)
+
+    def _capture(self, content):
+        handle, filename = tempfile.mkstemp(suffix=".pcapng")
+        os.write(handle, content)
+        os.close(handle)
+        self.addCleanup(os.remove, filename)
+
+        retval = CaptureFile(filename)
+        self.addCleanup(retval.close)
+
+        return retval
+
+    def test_valid(self):
+        capture = self._capture(SECTION_HEADER + INTERFACE + _packet("abc") + _packet("defgh", 2500000))
+        packets = [packet for chunk in capture.split(1) for packet in capture.packets(*chunk)]
+
+        self.assertEqual(packets, [(1, 1, 0, "abc"), (1, 2, 500000, "defgh")])
+
+    def test_invalid_block_length(self):
+        for length in (0, 8, 13, 1024):
+            capture = self._capture(SECTION_HEADER + INTERFACE + _block(6, "\x00" * 20, length) + _packet("abc"))
+            self.assertRaises(ValueError, capture.split, 1000)
+            self.assertRaises(ValueError, list, capture.packets())
+
+if __name__ == "__main__":
+    unittest.main()
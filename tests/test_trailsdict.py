@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+"""
+Copyright (c) 2014-2018 Miroslav Stampar (@stamparm)
+See the file 'LICENSE' for copying permission
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core.trails.snapshot import TrailsSnapshot
+from core.trails.snapshot import write_snapshot
+from core.trails.trailsdict import TrailsDict
+
+TRAILS = {
+    "evil.com": ("domain", "ref1"),
+    "evil.com/gate.php": ("url", "ref2"),
+    "evil.com/a/b.php": ("nested url", "ref3"),
+    "evil.com:8080/x": ("url with port", "ref4"),
+    "1.2.3.4:8080/panel": ("address url", "ref5"),
+    "/wp-admin/shell.php": ("path only url", "ref6"),
+    "evil.org/": ("root url", "ref7"),
+    "1.2.3.4": ("ip", "ref8"),
+    "1.2.3.4:80": ("address", "ref9"),
+}
+
+URL_LOOKUPS = (
+    ("evil.com", "/gate.php"), ("evil.co", "m/gate.php"), ("evil.com/gate", ".php"), ("", "evil.com/gate.php"), ("evil.com/gate.php", ""),
+    ("evil.com", "/a/b.php"), ("evil.com/a", "/b.php"), ("evil.com", "/a"),
+    ("evil.com:8080", "/x"), ("evil.com", ":8080/x"), ("evil.com", "/x"),
+    ("1.2.3.4:8080", "/panel"), ("1.2.3.4", ":8080/panel"),
+    ("", "/wp-admin/shell.php"), ("/wp-admin", "/shell.php"),
+    ("evil.org", "/"), ("evil.org/", ""), ("evil.org", ""),
+    ("evil.com", ""), ("", ""), ("1.2.3.4", ""), ("1.2.3.4", ":80"),
+)
+
+class TestBackends(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        self.dict_ = TrailsDict()
+        self.dict_.update(TRAILS)
+
+        filename = os.path.join(self.directory, "trails.bin")
+        write_snapshot(filename, TRAILS)
+        self.snapshot = TrailsSnapshot(filename)
+
+        self.attached = TrailsDict()
+        self.attached.attach(self.snapshot)
+
+    def test_get_url(self):
+        for host, path in URL_LOOKUPS:
+            expected = self.dict_.get_url(host, path)
+
+            for backend in (self.snapshot, self.attached):
+                self.assertEqual(backend.get_url(host, path), expected, (host, path))
+
+            self.assertEqual(expected, TRAILS.get("%s%s" % (host, path)) if '/' in host + path else None, (host, path))
+
+    def test_get(self):
+        for key in list(TRAILS) + ["%s%s" % _ for _ in URL_LOOKUPS]:
+            self.assertEqual(self.dict_.get(key), TRAILS.get(key), key)
+            self.assertEqual(self.snapshot.get(key), TRAILS.get(key), key)
+
+        self.assertEqual(sorted(self.dict_), sorted(TRAILS))
+        self.assertEqual(sorted(self.snapshot), sorted(TRAILS))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,5 @@
 import os
 import time
-import socket
 import core.logger as logger
 
 from core.settings import config
@@ -15,23 +14,12 @@ from core.utils.file_handler import get_write_handler
 # columns = ['flow ID', 'trail_type', 'info', 'reference', 'accuracy', 'severity', 'sec', 'usec', 'src_ip', 'dst_ip', 'src_port', 'dst_port', 'protocol']
 
 def create_event_entry(event):
-    src_port = "-"
-    dst_port = "-"
-
-    if event.packet.ip.get_ip_p() == socket.IPPROTO_TCP:
-        tcp = event.packet.ip.child()
-        src_port = tcp.get_th_sport()
-        dst_port = tcp.get_th_dport()
-    elif event.packet.ip.get_ip_p() == socket.IPPROTO_UDP:
-        udp = event.packet.ip.child()
-        src_port = udp.get_uh_sport()
-        dst_port = udp.get_uh_dport()
-
-    flow_id = event.packet.ip.get_ip_dst() + '-' + event.packet.ip.get_ip_src() + '-' + str(dst_port) + '-' + str(src_port) + '-' + str(event.packet.ip.get_ip_p())
+    flow = event.flow
+    flow_id = flow.dst_ip + '-' + flow.src_ip + '-' + str(flow.dst_port) + '-' + str(flow.src_port) + '-' + str(flow.protocol)
     
     return [
-        flow_id, event.trail_type, event.info, event.reference, event.accuracy, event.severity, event.packet.sec, 
-        event.packet.usec, event.packet.ip.get_ip_src(), event.packet.ip.get_ip_dst(), src_port, dst_port, event.packet.ip.get_ip_p()
+        flow_id, event.trail_type, event.info, event.reference, event.accuracy, event.severity, flow.sec, 
+        flow.usec, flow.src_ip, flow.dst_ip, flow.src_port, flow.dst_port, flow.protocol
     ]
 
 def worker():
@@ -42,7 +30,7 @@ def worker():
             event = q.get()
             entry = ' '.join([safe_value(s) for s in create_event_entry(event)]) + '\n'
 
-            file_location = os.path.join(config.LOG_DIR, 'events-' + get_sec_timestamp(int(event.packet.sec)) + '.csv')
+            file_location = os.path.join(config.LOG_DIR, 'events-' + get_sec_timestamp(int(event.flow.sec)) + '.csv')
             
             if config.SHOW_DEBUG:
                 logger.debug('Wrote event to csv log.')
@@ -13,9 +13,9 @@ open_handlers = {}
 def trigger(event, config):
     logger.warning('The log_file trigger is deprecated, please use csv_logger instead!')
     
-    file_location = os.path.join(config.LOG_DIR, 'events-' + get_sec_timestamp(int(event.packet.sec)) + '.log')
+    file_location = os.path.join(config.LOG_DIR, 'events-' + get_sec_timestamp(int(event.flow.sec)) + '.log')
     
-    localtime = "%s.%06d" % (time.strftime(TIME_FORMAT, time.localtime(int(event.packet.sec))), event.packet.usec)
+    localtime = "%s.%06d" % (time.strftime(TIME_FORMAT, time.localtime(int(event.flow.sec))), event.flow.usec)
     event_log_entry = "%s %s %s\n" % (safe_value(localtime), safe_value(config.SENSOR_NAME), " ".join(safe_value(_) for _ in event.createTuple()[2:]))
     
     if config.SHOW_DEBUG:
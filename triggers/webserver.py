@@ -1,24 +1,13 @@
 import requests
 import json
-import socket
 
 from core.settings import config
 
+__payload__ = True  # packet data is sent along with event
+
 def trigger(event, config):
   try:
-    packet_data = unicode(event.packet.ip.get_packet(), "latin-1")
-
-    src_port = "-"
-    dst_port = "-"
-
-    if event.packet.ip.get_ip_p() == socket.IPPROTO_TCP:
-      tcp = event.packet.ip.child()
-      src_port = tcp.get_th_sport()
-      dst_port = tcp.get_th_dport()
-    elif event.packet.ip.get_ip_p() == socket.IPPROTO_UDP:
-      udp = event.packet.ip.child()
-      src_port = udp.get_uh_sport()
-      dst_port = udp.get_uh_dport()
+    packet_data = unicode(event.packet.ip_data.tobytes(), "latin-1")
     
     data={
       "json": json.dumps({
@@ -31,12 +20,12 @@ def trigger(event, config):
           "accuracy": event.accuracy,
           "severity": event.severity,
           "packet": {
-            "sec": event.packet.sec,
-            "usec": event.packet.usec,
-            "src_ip": event.packet.ip.get_ip_src(),
-            "dst_ip": event.packet.ip.get_ip_dst(),
-            "src_port": src_port,
-            "dst_port": dst_port,
+            "sec": event.flow.sec,
+            "usec": event.flow.usec,
+            "src_ip": event.flow.src_ip,
+            "dst_ip": event.flow.dst_ip,
+            "src_port": event.flow.src_port,
+            "dst_port": event.flow.dst_port,
             "data": packet_data
           }
         }